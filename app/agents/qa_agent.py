@@ -1,15 +1,46 @@
 # app/agents/qa_agent.py
-from typing import Dict, Any, List
-from app.services.qa_agent import answer_query
+from typing import Dict, Any, List, AsyncIterator, Tuple
+from app.services.qa_agent import answer_query, answer_queries, prepare_answer
+from app.services.summarization import stream_ollama
+from app.services.executor import run_io
 from app.utils.logger import get_logger
 
 logger = get_logger("qa_agent_orchestrator")
 
-def ask(query: str, chat_history: List[Dict[str, str]] = None, k:int=5) -> Dict[str,Any]:
+def ask(query: str, chat_history: List[Dict[str, str]] = None, k:int=5, nprobe: int = None, ef_search: int = None,
+        use_cache: bool = True) -> Dict[str,Any]:
     """
     Single entrypoint for Q&A use by router. Wraps answer_query and logs.
     """
     logger.info("Received QA request: %s", query)
-    res = answer_query(query, chat_history=chat_history, k=k)
+    res = answer_query(query, chat_history=chat_history, k=k, nprobe=nprobe, ef_search=ef_search, use_cache=use_cache)
     logger.info("QA response: on_topic=%s", res.get("on_topic"))
     return res
+
+def ask_many(queries: List[str], k: int = 5, nprobe: int = None, ef_search: int = None,
+             use_cache: bool = True) -> List[Dict[str, Any]]:
+    """
+    Batch entrypoint for independent questions (e.g. grading runs).
+    """
+    logger.info("Received QA batch of %d queries", len(queries))
+    res = answer_queries(queries, k=k, nprobe=nprobe, ef_search=ef_search, use_cache=use_cache)
+    logger.info("QA batch done: %d on topic", sum(1 for r in res if r.get("on_topic")))
+    return res
+
+async def ask_stream(query: str, chat_history: List[Dict[str, str]] = None, k: int = 5,
+                     nprobe: int = None, ef_search: int = None, use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streamed `ask`: yields ("meta", response without the answer), then ("token", {"text"})
+    as the answer is generated, then ("done", full response).
+    """
+    logger.info("Received streamed QA request: %s", query)
+    res, prompt = await run_io(prepare_answer, query, chat_history=chat_history, k=k, nprobe=nprobe, ef_search=ef_search)
+    yield "meta", res
+    if prompt is not None:
+        pieces = []
+        async for piece in stream_ollama(prompt, use_cache=use_cache):
+            pieces.append(piece)
+            yield "token", {"text": piece}
+        res["answer"] = "".join(pieces).strip()
+    logger.info("QA stream done: on_topic=%s", res.get("on_topic"))
+    yield "done", res
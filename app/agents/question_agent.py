@@ -1,13 +1,134 @@
-from typing import List, Dict, Any
-from app.services.question_gen import generate_questions_from_text
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from app.services.question_gen import generate_questions_from_text, generate_questions_from_source
+from app.services.executor import run_io
 from app.utils.logger import get_logger
 
 logger = get_logger("question_agent")
 
-def create_QA(text: str, source: str = None, Q_type: str=None, n: int = 3, difficulty: int = 2) -> List[Dict[str, Any]]:
+QUESTION_JOB_CONCURRENCY = int(os.getenv("QUESTION_JOB_CONCURRENCY", "4"))  # items of one job generated at once
+QUESTION_JOB_HISTORY = int(os.getenv("QUESTION_JOB_HISTORY", "100"))  # finished jobs kept for status queries
+
+def create_QA(text: str, source: str = None, Q_type: str=None, n: int = 3, difficulty: int = 2,
+              use_cache: bool = True, mode: str = "auto") -> List[Dict[str, Any]]:
     """
     Generate questions and immediately run self-reflection on each generated question.
+    mode="retrieval" (or "auto" without text) grounds them in the source's indexed chunks.
+    """
+    if mode == "retrieval" or (mode == "auto" and not text):
+        if not source:
+            raise ValueError("Generating from indexed chunks needs a source")
+        return generate_questions_from_source(source, Q_type=Q_type, n=n, difficulty=difficulty, use_cache=use_cache)
+    if not text:
+        raise ValueError("No text given; pass text or use mode 'retrieval' with an indexed source")
+    questions = generate_questions_from_text(text, source=source, Q_type=Q_type, n=n, difficulty=difficulty,
+                                             use_cache=use_cache)
+    return questions
+
+class QuestionJob:
     """
-    
-    questions = generate_questions_from_text(text, source=source, Q_type=Q_type, n=n, difficulty=difficulty)
-    return questions
\ No newline at end of file
+    A batch of question-generation items run concurrently on the event loop.
+    Progress is kept as an append-only event list so any number of followers can replay and tail it.
+    Jobs live in the worker process that accepted them.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], concurrency: int):
+        self.id = str(uuid.uuid4())
+        self.items = items
+        self.concurrency = max(1, concurrency)
+        self.status = "queued"
+        self.completed = 0
+        self.failed = 0
+        self.question_ids: List[str] = []
+        self.errors: Dict[int, str] = {}
+        self.created = time.time()
+        self.finished: float = None
+        self.events: List[Tuple[str, Any]] = []
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _emit(self, event: str, data: Any):
+        self.events.append((event, data))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()  # wakes followers waiting on the previous event
+
+    async def _run_item(self, index: int, item: Dict[str, Any], slots: asyncio.Semaphore):
+        async with slots:
+            try:
+                questions = await run_io(create_QA, item.get("text"), item.get("source"), item.get("Q_type"),
+                                         item.get("n_questions", 3), item.get("difficulty", 2),
+                                         use_cache=item.get("use_cache", True), mode=item.get("mode", "auto"))
+            except Exception as e:
+                logger.warning("Question job %s item %d failed: %s", self.id, index, e)
+                self.failed += 1
+                self.errors[index] = str(e)
+                self._emit("item_failed", {"index": index, "source": item.get("source"), "error": str(e)})
+                return
+        self.completed += 1
+        self.question_ids.extend(q["question_id"] for q in questions)
+        for q in questions:
+            self._emit("question", {"index": index, **jsonable_encoder(q)})
+        self._emit("item_done", {"index": index, "source": item.get("source"), "n_questions": len(questions)})
+
+    async def run(self):
+        self.status = "running"
+        logger.info("Question job %s: %d items, concurrency %d", self.id, len(self.items), self.concurrency)
+        slots = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._run_item(i, item, slots) for i, item in enumerate(self.items)))
+        self.status = "failed" if self.items and self.failed == len(self.items) else "done"
+        self.finished = time.time()
+        logger.info("Question job %s %s: %d items ok, %d failed, %d questions", self.id, self.status,
+                    self.completed, self.failed, len(self.question_ids))
+        self._emit("done", self.info())
+
+    async def follow(self) -> AsyncIterator[Tuple[str, Any]]:
+        """Every event so far, then new ones as they happen, until the job finishes."""
+        i = 0
+        while True:
+            changed = self._changed
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                return
+            await changed.wait()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.items),
+            "completed": self.completed,
+            "failed": self.failed,
+            "question_ids": list(self.question_ids),
+            "errors": dict(self.errors),
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+_jobs: "OrderedDict[str, QuestionJob]" = OrderedDict()
+
+
+def submit_job(items: List[Dict[str, Any]], concurrency: int = None) -> QuestionJob:
+    """Start a batch job on the running event loop; generated questions are stored as each item finishes."""
+    job = QuestionJob(items, concurrency or QUESTION_JOB_CONCURRENCY)
+    _jobs[job.id] = job
+    finished = [job_id for job_id, j in _jobs.items() if j.done]
+    for job_id in finished[:max(0, len(finished) - QUESTION_JOB_HISTORY)]:
+        del _jobs[job_id]
+    job._task = asyncio.get_running_loop().create_task(job.run())
+    return job
+
+
+def get_job(job_id: str) -> Optional[QuestionJob]:
+    return _jobs.get(job_id)
@@ -1,36 +1,184 @@
-from typing import Dict, Any
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, AsyncIterator, Callable, List, Tuple
 from app.utils.logger import get_logger
-from app.services.summarization import extractive_summary, abstractive_summary, generate_TOC
+from app.services.summarization import extractive_summary, abstractive_summary, abstractive_prompt, generate_TOC, \
+    map_reduce_extractive, map_reduce_TOC, needs_map_reduce, stream_ollama
+from app.services.executor import run_io
+from app.services.summary_store import SummaryStore, open_store
 import uuid
 
 logger = get_logger(name="summarizer_agent")
 
-SUMMARY_STORE: Dict[str, Dict[str, Any]] = {}
+SUMMARY_STORE: SummaryStore = open_store()
+
+
+def _timed(fn: Callable, kwargs: Dict[str, Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    return fn(**kwargs), time.perf_counter() - start
+
+
+def _run_stages(stages: Dict[str, Tuple[Callable, List[str]]],
+                known: Dict[str, Any] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Run named stages as a small DAG: `stages[name] = (fn, deps)`, where fn takes the results of
+    its deps as keyword arguments and starts as soon as they are all done.
+    Stages whose result is already in `known` are not run.
+    Returns (results, seconds per stage run).
+    """
+    results: Dict[str, Any] = dict(known or {})
+    timings: Dict[str, float] = {}
+    pending = {name: stage for name, stage in stages.items() if name not in results}
+    with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+        running = {}
+        while pending or running:
+            for name, (fn, deps) in list(pending.items()):
+                if all(d in results for d in deps):
+                    running[pool.submit(_timed, fn, {d: results[d] for d in deps})] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f"Unsatisfiable stage dependencies: {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], timings[name] = future.result()
+    return results, timings
+
+
+def _text_stages(text: str, mode: str) -> Tuple[Callable, Callable]:
+    """Extractive and TOC functions for `text`: single-prompt, or map-reduce for long texts."""
+    if mode == "map_reduce" or (mode == "auto" and needs_map_reduce(text)):
+        return map_reduce_extractive, map_reduce_TOC
+    return extractive_summary, generate_TOC
+
+
+def _stage_keys(text: str, extract: Callable, outline: Callable, toc_level: int, extractive_sentance: int) -> Dict[str, str]:
+    """What each text stage's output depends on: the text (by hash), the method and its options."""
+    text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return {
+        "extractive": f"{text_hash}:{extract.__name__}:{extractive_sentance}",
+        "toc": f"{text_hash}:{outline.__name__}:{toc_level}",
+    }
+
+
+def _reusable_stages(summary_id: str, stage_keys: Dict[str, str], use_cache: bool) -> Dict[str, Any]:
+    """
+    Stage outputs of the stored revision of `summary_id` that were computed from the same text
+    and options, so a feedback-only revision reruns just the abstract.
+    """
+    previous = SUMMARY_STORE.get(summary_id) if use_cache else None
+    if not previous:
+        return {}
+    previous_keys = previous.get("stage_keys", {})
+    return {stage: previous[stage] for stage, key in stage_keys.items() if previous_keys.get(stage) == key}
+
+
 def create_summary(text:str, summary_id:str=None, feedback:str=None, source:str=None, toc_level:int=3,
                    extractive_sentance:int=8,
-                   abstractive_style:str="concise",) -> Dict[str, Any]:
+                   abstractive_style:str="concise", mode:str="auto", use_cache:bool=True) -> Dict[str, Any]:
     
     """
     Create a summary of the text using extractive and abstractive methods.
+    mode: "single" prompt per stage, "map_reduce" over sections, or "auto" (map-reduce when the text is too long).
+    use_cache=False regenerates every stage instead of reusing cached LLM responses.
     """
     if summary_id is None:
         summary_id = str(uuid.uuid4())
     
-    logger.info("Creating summary %s for source %s", summary_id, source)
-    key_points = extractive_summary(text, extractive_sentance)
-    toc = generate_TOC(text, toc_level)
-    abstract = abstractive_summary(key_points, toc, abstractive_style, feedback)
+    extract, outline = _text_stages(text, mode)
+    stage_keys = _stage_keys(text, extract, outline, toc_level, extractive_sentance)
+    reused = _reusable_stages(summary_id, stage_keys, use_cache)
+    logger.info("Creating summary %s for source %s (%s, reusing %s)", summary_id, source, extract.__name__,
+                sorted(reused) or "nothing")
+    start = time.perf_counter()
+    # extractive and TOC only need the text, so they run concurrently; the abstract waits for both
+    results, timings = _run_stages({
+        "extractive": (lambda: extract(text, extractive_sentance, use_cache=use_cache), []),
+        "toc": (lambda: outline(text, toc_level, use_cache=use_cache), []),
+        "abstract": (lambda extractive, toc: abstractive_summary(extractive, toc, abstractive_style, feedback,
+                                                                 use_cache=use_cache),
+                     ["extractive", "toc"]),
+    }, known=reused)
+    timings["total"] = time.perf_counter() - start
+    logger.info("Summary %s stage timings: %s", summary_id, {k: round(v, 2) for k, v in timings.items()})
     
     payload = {
         "id": summary_id,
         "source": source,
-        "toc": toc,
-        "extractive": key_points,
-        "abstract": abstract,
-        "comments": feedback
+        "toc": results["toc"],
+        "extractive": results["extractive"],
+        "abstract": results["abstract"],
+        "comments": feedback,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+        "reused_stages": sorted(reused),
+        "stage_keys": stage_keys,
     }
-    SUMMARY_STORE[summary_id] = payload    
-    return SUMMARY_STORE[summary_id]
+    SUMMARY_STORE.put(payload)
+    return payload
 
-    
 
+async def stream_summary(text:str, summary_id:str=None, feedback:str=None, source:str=None, toc_level:int=3,
+                         extractive_sentance:int=8,
+                         abstractive_style:str="concise", mode:str="auto",
+                         use_cache:bool=True) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streamed `create_summary`: yields ("extractive", key points) and ("toc", toc) in whichever
+    order those concurrent stages finish, ("token", {"text"}) while the abstract is generated,
+    then ("done", payload).
+    """
+    if summary_id is None:
+        summary_id = str(uuid.uuid4())
+
+    extract, outline = _text_stages(text, mode)
+    stage_keys = _stage_keys(text, extract, outline, toc_level, extractive_sentance)
+    reused = await run_io(_reusable_stages, summary_id, stage_keys, use_cache)
+    logger.info("Streaming summary %s for source %s (%s, reusing %s)", summary_id, source, extract.__name__,
+                sorted(reused) or "nothing")
+    start = time.perf_counter()
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    for name, result in reused.items():
+        results[name] = result
+        yield name, result
+    stage_calls = {
+        "extractive": (extract, {"text": text, "n_sentences": extractive_sentance, "use_cache": use_cache}),
+        "toc": (outline, {"text": text, "max_level": toc_level, "use_cache": use_cache}),
+    }
+    tasks = {asyncio.ensure_future(run_io(_timed, fn, kwargs)): name
+             for name, (fn, kwargs) in stage_calls.items() if name not in reused}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                results[name], timings[name] = task.result()
+                yield name, results[name]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    abstract_start = time.perf_counter()
+    pieces = []
+    async for piece in stream_ollama(abstractive_prompt(results["extractive"], results["toc"], abstractive_style, feedback),
+                                     use_cache=use_cache):
+        pieces.append(piece)
+        yield "token", {"text": piece}
+    timings["abstract"] = time.perf_counter() - abstract_start
+    timings["total"] = time.perf_counter() - start
+
+    payload = {
+        "id": summary_id,
+        "source": source,
+        "toc": results["toc"],
+        "extractive": results["extractive"],
+        "abstract": "".join(pieces).strip(),
+        "comments": feedback,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+        "reused_stages": sorted(reused),
+        "stage_keys": stage_keys,
+    }
+    await run_io(SUMMARY_STORE.put, payload)
+    yield "done", payload
@@ -34,6 +34,18 @@ def api_post(url: str, json_data=None, files=None, params=None):
         return None
 
 
+def api_stream(url: str, json_data=None):
+    """Yield (event, data) pairs from a Server-Sent Events endpoint."""
+    with requests.post(url, json={**json_data, "stream": True}, stream=True) as r:
+        r.raise_for_status()
+        event = None
+        for line in r.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield event, json.loads(line[len("data: "):])
+
+
 # Session state init
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -188,32 +200,28 @@ with tabs[1]:
                 "comments": FeedBack
             }
 
-            progress_bar = st.progress(0)
             status_placeholder = st.empty()
+            status_placeholder.text("Extracting key points and table of contents...")
+            abstract_placeholder = st.empty()
+
+            resp = None
+            abstract = ""
+            try:
+                for event, data in api_stream(SUMMARIZE, json_data=payload):
+                    if event == "toc":
+                        status_placeholder.text("Writing summary...")
+                    elif event == "token":
+                        abstract += data["text"]
+                        abstract_placeholder.markdown(abstract)
+                    elif event == "done":
+                        resp = {**data, "abstract_summary": data["abstract"]}
+                    elif event == "error":
+                        st.error(f"Summary failed: {data.get('detail')}")
+            except Exception as e:
+                st.error(f"API request failed: {e}")
+            abstract_placeholder.empty()
+            status_placeholder.text("Summary complete ✅" if resp else "")
 
-            resp_container = {"resp": None}
-            done_event = threading.Event()
-
-            def run_request():
-                try:
-                    resp_container["resp"] = api_post(SUMMARIZE, json_data=payload)
-                finally:
-                    done_event.set()
-
-            worker = threading.Thread(target=run_request, daemon=True)
-            worker.start()
-
-            pct = 0
-            while not done_event.is_set():
-                progress_bar.progress(pct)
-                status_placeholder.text(f"Summarizing... {pct}%")
-                time.sleep(3)
-                pct = pct + 1 if pct < 95 else 95
-
-            progress_bar.progress(100)
-            status_placeholder.text("Summary complete ✅")
-
-            resp = resp_container["resp"]
             if resp:
                 sid = str(uuid.uuid4())
                 st.session_state.summaries[sid] = {
@@ -376,7 +384,7 @@ with tabs[3]:
 
             res = result_holder["resp"]
             if res:
-                st.success(f"Ingested docs: {res.get('added')} (index size: {res.get('index_size')})")
+                st.success(f"Ingested docs: {res.get('added')} (skipped duplicates: {res.get('skipped', 0)}, index size: {res.get('index_size')})")
 
     st.subheader("Ask a question")
     q_input = st.text_input("Your question")
@@ -386,38 +394,30 @@ with tabs[3]:
         else:
             payload = {"query": q_input, "chat_history": st.session_state.chat_history, "k": 5}
 
-            # progress placeholders
-            progress_bar = st.progress(0)
-            status_placeholder = st.empty()
-            done_event = threading.Event()
-            result_holder = {"resp": None}
-
-            def run_request():
-                try:
-                    result_holder["resp"] = api_post(QA_ASK, json_data=payload)
-                finally:
-                    done_event.set()
-
-            threading.Thread(target=run_request).start()
+            st.markdown("**Answer:**")
+            answer_placeholder = st.empty()
+            answer_placeholder.text("Searching the course materials...")
+
+            res = None
+            answer = ""
+            try:
+                for event, data in api_stream(QA_ASK, json_data=payload):
+                    if event == "token":
+                        answer += data["text"]
+                        answer_placeholder.markdown(answer)
+                    elif event == "done":
+                        res = data
+                    elif event == "error":
+                        st.error(f"Answer failed: {data.get('detail')}")
+            except Exception as e:
+                st.error(f"API request failed: {e}")
 
-            pct = 0
-            while not done_event.is_set():
-                progress_bar.progress(pct)
-                status_placeholder.text(f"Asking... {pct}%")
-                time.sleep(3)
-                pct = pct + 2 if pct < 95 else 95
-
-            done_event.wait()
-            progress_bar.progress(100)
-            status_placeholder.text("Done ✅")
-
-            res = result_holder["resp"]
             if res:
                 if not res.get("on_topic"):
+                    answer_placeholder.empty()
                     st.warning(res.get("redirect"))
                 else:
-                    st.markdown("**Answer:**")
-                    st.write(res.get("answer"))
+                    answer_placeholder.write(res.get("answer"))
                     st.markdown("**Sources:**")
                     for s in res.get("sources", []):
                         st.write(f"- {s}")
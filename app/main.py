@@ -1,12 +1,39 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from .routers import preprocess, summarize, questions, qa
+from .services import model_registry, executor, llm_client
+from .services.summarization import get_llm_cache_stats, get_json_parse_stats
+from .services.question_gen import QUESTION_INDEX
 
 app = FastAPI(title="J.A.R.V.I.S - Study Assistant", version="0.1")
 
 
+@app.on_event("startup")
+def warm_up_models():
+    # models load in the background so the API accepts requests right away
+    model_registry.warm_up()
+
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    executor.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.aclose()
+
+
+@app.exception_handler(model_registry.ModelUnavailableError)
+async def model_unavailable_handler(request: Request, exc: model_registry.ModelUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "CourseTA API is running"}
+    return {"status": "ok", "message": "CourseTA API is running", **model_registry.status(), "executors": executor.stats(),
+            "llm": {**llm_client.stats(), "cache": get_llm_cache_stats(), "json": get_json_parse_stats()},
+            "question_dedup": QUESTION_INDEX.info()}
 
 
 
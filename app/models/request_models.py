@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Literal
 
 class preprocessResponse(BaseModel):
     source: str
@@ -14,6 +14,9 @@ class SummarizeRequest(BaseModel):
     extractive_sentences: int = Field(8, description="How many key sentences for extractive step")
     abstractive_style: Optional[str] = Field("concise", description="Tone for abstractive summary (e.g., concise, detailed)")
     comments: str = None
+    stream: bool = Field(False, description="Stream the summary as Server-Sent Events")
+    mode: Literal["auto", "single", "map_reduce"] = Field("auto", description="map_reduce summarizes long texts section by section; auto picks it when the text does not fit one prompt")
+    use_cache: bool = Field(True, description="Reuse cached LLM responses for identical prompts; false forces fresh generations")
     
 class SummarizeResponse(BaseModel):
     summary_id: str
@@ -22,6 +25,15 @@ class SummarizeResponse(BaseModel):
     extractive: List[str]
     abstract_summary: str
     comments: Optional[str] = None
+    timings: Optional[Dict[str, float]] = Field(None, description="Seconds spent per stage, plus the end-to-end total")
+    reused_stages: List[str] = Field(default_factory=list, description="Stages taken from the previous revision of this summary_id")
+
+
+class SummaryInfo(BaseModel):
+    summary_id: str
+    source: Optional[str] = None
+    created: float
+    updated: float
 
 
 class Option(BaseModel):
@@ -38,12 +50,35 @@ class QuestionItem(BaseModel):
     difficulty: int = Field(1, ge=1, le=5)
     rationale: Optional[str] = None  # explanation for the answer
     
+class QuestionPage(BaseModel):
+    total: int = Field(..., description="Questions matching the filters")
+    limit: int
+    offset: int
+    items: List[QuestionItem]
+    
 class QGenRequest(BaseModel):
-    text: str
+    text: Optional[str] = Field(None, description="Text to generate from; omit it to generate from the source's indexed chunks")
     source: str = None
+    mode: Literal["auto", "text", "retrieval"] = Field("auto", description="retrieval sends only a few diverse indexed chunks of `source` to the LLM instead of the full text; auto picks it when no text is given")
     n_questions: int = 3
     difficulty: int = 2
-    Q_type: str = None
+    Q_type: Literal["mcq", "tf"] = "mcq"
+    use_cache: bool = Field(True, description="Reuse cached LLM responses for identical prompts; false forces fresh generations")
+
+class QGenBatchRequest(BaseModel):
+    items: List[QGenRequest] = Field(..., description="Texts to generate questions for, one job item each")
+    concurrency: Optional[int] = Field(None, ge=1, description="Items generated at once (default QUESTION_JOB_CONCURRENCY)")
+
+class QGenJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, done, or failed (every item failed)")
+    total: int
+    completed: int
+    failed: int
+    question_ids: List[str]
+    errors: Dict[int, str] = Field(default_factory=dict, description="Error per failed item index")
+    created: float
+    finished: Optional[float] = None
 
 class docIn(BaseModel):
     id: str
@@ -53,15 +88,35 @@ class docIn(BaseModel):
 
 class IngestRequest(BaseModel):
     docs: List[docIn]
+    on_duplicate: Literal["skip", "upsert"] = Field("skip", description="What to do with docs whose text is already indexed")
+
+class DeleteDocumentsRequest(BaseModel):
+    doc_ids: Optional[List[str]] = Field(None, description="Delete every chunk of these documents")
+    source: Optional[str] = Field(None, description="Delete every chunk ingested from this source")
 
 class QArequest(BaseModel):
     query: str
     chat_history: Optional[List[Dict[str,str]]] = None
     k: Optional[int] = 5
+    nprobe: Optional[int] = Field(None, description="IVF lists to probe (higher = better recall, slower)")
+    ef_search: Optional[int] = Field(None, description="HNSW search depth (higher = better recall, slower)")
+    stream: bool = Field(False, description="Stream the answer as Server-Sent Events")
+    use_cache: bool = Field(True, description="Reuse cached LLM responses for identical prompts; false forces fresh generations")
     
 class QAResponse(BaseModel):
     on_topic: bool
     answer: Optional[str] = None
     redirect: Optional[str] = None
     sources: List[str]
-    retrievals: Optional[List[Dict[str,Any]]] = None
\ No newline at end of file
+    retrievals: Optional[List[Dict[str,Any]]] = None
+    error: Optional[str] = None
+
+class QABatchRequest(BaseModel):
+    queries: List[str] = Field(..., description="Independent questions answered in one batch")
+    k: Optional[int] = 5
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    use_cache: bool = Field(True, description="Reuse cached LLM responses for identical prompts; false forces fresh generations")
+
+class QABatchResponse(BaseModel):
+    results: List[QAResponse]
\ No newline at end of file
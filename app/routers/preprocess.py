@@ -1,9 +1,11 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket
+from contextlib import aclosing
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
 from app.utils.file_utils import save_upload_file
-from app.services.preprocessing import extract_audio, transcribe_audio, parse_pdf
+from app.services.preprocessing import parse_pdf, audio_duration, astream_transcription, atranscribe
 from app.models.request_models import preprocessResponse
+from app.services.executor import run_io, run_cpu
 import os
-import asyncio
 
 router = APIRouter(prefix='/preprocess', tags=["Preprocessing"])
 
@@ -19,13 +21,10 @@ async def preprocess_input(file: UploadFile = File(...)):
 
     try:
         if file.content_type == "application/pdf":
-            text = parse_pdf(file_path)
-        elif file.content_type.startswith("audio/"):
-            text = transcribe_audio(file_path)
-        elif file.content_type.startswith("video/"):
-            audio_path = extract_audio(file_path)
-            text = transcribe_audio(audio_path)
-            os.remove(audio_path)
+            text = await run_cpu(parse_pdf, file_path)
+        elif file.content_type.startswith(("audio/", "video/")):
+            # ffmpeg reads the audio track of a video directly; windows are transcribed in parallel
+            text = await atranscribe(file_path)
         else:
             raise HTTPException(
                 status_code=400,
@@ -41,45 +40,37 @@ async def preprocess_input(file: UploadFile = File(...)):
 async def preprocess_ws(websocket: WebSocket):
     """
     WebSocket endpoint: streams progress updates while preprocessing.
-    Frontend (Streamlit) can listen and update progress bar.
+    Audio and video are transcribed window by window and every transcribed segment
+    ({start, end, text}) is sent as soon as it is ready, with progress measured against
+    the media duration. Frontend (Streamlit) can listen and update progress bar.
     """
     await websocket.accept()
+    filepath = None
 
     try:
         # Step 1: Wait for client to send metadata
         data = await websocket.receive_json()
         filename = data.get("filename")
-        filetype = data.get("content_type")
+        filetype = data.get("content_type") or ""
         filepath = data.get("file_path")  # path must exist on server
 
-        # Simulate steps with progress
-        steps = []
         if filetype == "application/pdf":
-            steps = ["Parsing PDF", "Cleaning text", "Finalizing"]
-        elif filetype.startswith("audio/"):
-            steps = ["Extracting audio", "Transcribing", "Finalizing"]
-        elif filetype.startswith("video/"):
-            steps = ["Extracting audio", "Transcribing video", "Finalizing"]
+            await websocket.send_json({"progress": 0, "status": "Parsing PDF"})
+            text = await run_cpu(parse_pdf, filepath)
+        elif filetype.startswith(("audio/", "video/")):
+            duration = await run_io(audio_duration, filepath)
+            await websocket.send_json({"progress": 0, "status": "Transcribing", "duration": duration})
+            texts = []
+            async with aclosing(astream_transcription(filepath)) as segments:
+                async for segment in segments:
+                    texts.append(segment["text"])
+                    progress = min(99, int(segment["end"] / duration * 100)) if duration else None
+                    await websocket.send_json({"progress": progress, "status": "Transcribing", "segment": segment})
+            text = " ".join(texts)
         else:
             await websocket.send_json({"error": f"Unsupported file type: {filetype}"})
-            await websocket.close()
             return
 
-        for i, step in enumerate(steps, start=1):
-            await asyncio.sleep(1)  # simulate delay (replace with real processing chunks)
-            progress = int((i / len(steps)) * 100)
-            await websocket.send_json({"progress": progress, "status": step})
-
-        # Actually process file
-        if filetype == "application/pdf":
-            text = parse_pdf(filepath)
-        elif filetype.startswith("audio/"):
-            text = transcribe_audio(filepath)
-        elif filetype.startswith("video/"):
-            audio_path = extract_audio(filepath)
-            text = transcribe_audio(audio_path)
-            os.remove(audio_path)
-
         # Final result
         await websocket.send_json({
             "progress": 100,
@@ -87,11 +78,14 @@ async def preprocess_ws(websocket: WebSocket):
             "result": {"source": filename, "text": text}
         })
 
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         await websocket.send_json({"error": str(e)})
     finally:
-        await websocket.close()
-        if os.path.exists(filepath):
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+        if filepath and os.path.exists(filepath):
             os.remove(filepath)
 
 # @router.post("/audio", response_model=preprocessResponse)
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from app.agents.qa_agent import ask
-from app.services.embeddings import add_documents, get_index_size
-from app.models.request_models import QArequest, QAResponse, IngestRequest
+from app.agents.qa_agent import ask, ask_many, ask_stream
+from app.utils.sse import sse_response
+from app.services.embeddings import add_documents, delete_documents, upsert_documents, get_index_size, get_query_cache_stats
+from app.services.model_registry import ModelUnavailableError
+from app.services.executor import run_io, run_cpu
+from app.models.request_models import QArequest, QAResponse, IngestRequest, QABatchRequest, QABatchResponse, DeleteDocumentsRequest
 
 router = APIRouter(prefix="/qa", tags=["QA"])
 
@@ -17,15 +20,71 @@ async def ingest(req: IngestRequest):
     docs = []
     for d in req.docs:
         docs.append({"id": d.id, "text": d.text, "source": d.source, "meta": d.meta or {}})
-    added = add_documents(docs)
-    return {"added": added, "index_size": get_index_size()}
+    added, skipped = await run_cpu(add_documents, docs, on_duplicate=req.on_duplicate)
+    return {"added": added, "skipped": len(skipped), "index_size": get_index_size()}
+
+@router.put("/documents")
+async def upsert(req: IngestRequest):
+    """
+    Replace documents by id: their existing chunks are deleted and the new text is ingested.
+    """
+    docs = [{"id": d.id, "text": d.text, "source": d.source, "meta": d.meta or {}} for d in req.docs]
+    added, replaced = await run_cpu(upsert_documents, docs)
+    return {"added": added, "replaced": replaced, "index_size": get_index_size()}
+
+@router.delete("/documents")
+async def delete(req: DeleteDocumentsRequest):
+    """
+    Delete documents by id and/or every document of a source.
+    """
+    if not req.doc_ids and req.source is None:
+        raise HTTPException(status_code=400, detail="Provide doc_ids and/or source")
+    deleted = await run_cpu(delete_documents, doc_ids=req.doc_ids, source=req.source)
+    return {"deleted": deleted, "index_size": get_index_size()}
+
+@router.get("/cache_stats")
+async def cache_stats():
+    """
+    Hit/miss/eviction counters of the query-embedding cache.
+    """
+    return get_query_cache_stats()
 
 @router.post("/ask", response_model=QAResponse)
 async def ask_question(req: QArequest):
+    """
+    Answer a question; with `stream` set, the answer is sent as Server-Sent Events
+    (`meta`, then `token` pieces, then `done` with the full response, or `error`).
+    """
+    if req.stream:
+        return sse_response(ask_stream(req.query, chat_history=req.chat_history or [], k=req.k or 5,
+                                       nprobe=req.nprobe, ef_search=req.ef_search, use_cache=req.use_cache))
     try:
-        res = ask(req.query, chat_history=req.chat_history or [], k=req.k or 5)
+        res = await run_io(ask, req.query, chat_history=req.chat_history or [], k=req.k or 5, nprobe=req.nprobe,
+                           ef_search=req.ef_search, use_cache=req.use_cache)
         if not res["on_topic"]:
             return QAResponse(on_topic=False, answer=None, redirect=res["redirect"], sources=[])
         return QAResponse(on_topic=True, answer=res["answer"], redirect=None, sources=res["sources"], retrievals=res.get("retrievals"))
+    except ModelUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/ask_batch", response_model=QABatchResponse)
+async def ask_batch(req: QABatchRequest):
+    """
+    Answer many independent questions with one batched retrieval; results keep the order of `queries`.
+    """
+    try:
+        results = []
+        for res in await run_io(ask_many, req.queries, k=req.k or 5, nprobe=req.nprobe, ef_search=req.ef_search,
+                                use_cache=req.use_cache):
+            if not res["on_topic"]:
+                results.append(QAResponse(on_topic=False, answer=None, redirect=res["redirect"], sources=[]))
+            else:
+                results.append(QAResponse(on_topic=True, answer=res["answer"], redirect=None, sources=res["sources"],
+                                          retrievals=res.get("retrievals"), error=res.get("error")))
+        return QABatchResponse(results=results)
+    except ModelUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,26 +1,82 @@
 # app/routers/questions.py
-from fastapi import APIRouter, HTTPException
-from typing import List
-from app.models.request_models import QuestionItem, QGenRequest
-from app.agents.question_agent import create_QA
-from app.services.question_gen import QUESTIONS
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional, Dict, Any
+from app.models.request_models import QuestionItem, QGenRequest, QuestionPage, QGenBatchRequest, QGenJobStatus
+from app.agents.question_agent import create_QA, submit_job, get_job
+from app.services.question_gen import QUESTION_STORE, SourceNotIndexedError
+from app.services.executor import run_io
+from app.utils.sse import sse_response
 
 
 router = APIRouter(prefix="/questions", tags=["Questions"])
 
+def _to_item(q: Dict[str, Any]) -> QuestionItem:
+    return QuestionItem(
+        id=q["question_id"],
+        source=q["source"],
+        type=q["type"],
+        question=q["question"],
+        options=q["options"],
+        answer=q["answer"],
+        difficulty=q["difficulty"],
+        rationale=q["rationale"],
+    )
+
 @router.post("/generate_QA", response_model=List[QuestionItem])
 async def generate_questions(request: QGenRequest):
+    retrieval = request.mode == "retrieval" or (request.mode == "auto" and not request.text)
+    if (retrieval and not request.source) or (not retrieval and not request.text):
+        raise HTTPException(status_code=400, detail="Pass text, or a source already ingested into the index")
     try:
-        questions = create_QA(request.text, request.source, request.Q_type, request.n_questions, request.difficulty)
-        return [QuestionItem(
-            id=q["question_id"],
-            source=q["source"],
-            type=q["type"],
-            question=q["question"],
-            options=q["options"],
-            answer=q["answer"],
-            difficulty=q["difficulty"],
-            rationale=q["rationale"],
-        ) for q in questions]
+        questions = await run_io(create_QA, request.text, request.source, request.Q_type, request.n_questions, request.difficulty,
+                                 use_cache=request.use_cache, mode=request.mode)
+        return [_to_item(q) for q in questions]
+    except SourceNotIndexedError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/jobs", response_model=QGenJobStatus)
+async def submit_question_job(request: QGenBatchRequest):
+    """
+    Generate questions for many texts in the background; questions are stored as each item finishes.
+    Follow progress with GET /questions/jobs/{job_id} or /questions/jobs/{job_id}/stream.
+    """
+    job = submit_job([item.model_dump() for item in request.items], request.concurrency)
+    return QGenJobStatus(**job.info())
+
+@router.get("/jobs/{job_id}", response_model=QGenJobStatus)
+async def question_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return QGenJobStatus(**job.info())
+
+@router.get("/jobs/{job_id}/stream")
+async def follow_question_job(job_id: str):
+    """
+    Server-Sent Events of a job, replayed from the start: `question` for each stored question,
+    `item_done` / `item_failed` per item, and a final `done` with the job status.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return sse_response(job.follow())
+
+@router.get("/search", response_model=QuestionPage)
+async def search_questions(source: Optional[str] = None, q_type: Optional[str] = Query(None, alias="type"),
+                           difficulty: Optional[int] = Query(None, ge=1, le=5),
+                           limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """
+    Page through the question bank, newest first, filtered by source, type and/or difficulty.
+    """
+    items, total = await run_io(QUESTION_STORE.query, source=source, q_type=q_type, difficulty=difficulty,
+                                limit=limit, offset=offset)
+    return QuestionPage(total=total, limit=limit, offset=offset, items=[_to_item(q) for q in items])
+
+@router.get("/{question_id}", response_model=QuestionItem)
+async def get_question(question_id: str):
+    q = await run_io(QUESTION_STORE.get, question_id)
+    if q is None:
+        raise HTTPException(status_code=404, detail=f"Question {question_id} not found")
+    return _to_item(q)
\ No newline at end of file
@@ -1,13 +1,47 @@
-from fastapi import APIRouter, HTTPException
-from app.models.request_models import SummarizeRequest, SummarizeResponse
-from app.agents.summarizer_agent import create_summary, SUMMARY_STORE
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional, Dict, Any
+from app.models.request_models import SummarizeRequest, SummarizeResponse, SummaryInfo
+from app.agents.summarizer_agent import create_summary, stream_summary, SUMMARY_STORE
+from app.services.executor import run_io
+from app.utils.sse import sse_response
 
 router = APIRouter(prefix="/summarize", tags=["Summarization"])
 
+
+def _to_response(payload: Dict[str, Any]) -> SummarizeResponse:
+    return SummarizeResponse(
+        summary_id=payload["id"],
+        source=payload["source"],
+        toc=payload["toc"],
+        extractive=payload["extractive"],
+        abstract_summary=payload["abstract"],
+        comments=payload["comments"],
+        timings=payload.get("timings"),
+        reused_stages=payload.get("reused_stages", []),
+    )
+
+
 @router.post("/Summary", response_model=SummarizeResponse)
 async def summarize(request: SummarizeRequest):
+    """
+    Summarize text; with `stream` set, stages are sent as Server-Sent Events
+    (`extractive`, `toc`, `token` pieces of the abstract, then `done` with the full summary, or `error`).
+    """
+    if request.stream:
+        return sse_response(stream_summary(
+            text=request.text,
+            summary_id=request.summary_id,
+            feedback=request.comments,
+            source=request.source,
+            toc_level=request.toc_levels,
+            extractive_sentance=request.extractive_sentences,
+            abstractive_style=request.abstractive_style,
+            mode=request.mode,
+            use_cache=request.use_cache,
+        ))
     try:
-        payload = create_summary(
+        payload = await run_io(
+            create_summary,
             text=request.text,
             summary_id=request.summary_id,
             feedback=request.comments,
@@ -15,14 +49,27 @@ async def summarize(request: SummarizeRequest):
             toc_level=request.toc_levels,
             extractive_sentance=request.extractive_sentences,
             abstractive_style=request.abstractive_style,
+            mode=request.mode,
+            use_cache=request.use_cache,
         )
-        return SummarizeResponse(
-            summary_id=payload["id"],
-            source=payload["source"],
-            toc=payload["toc"],
-            extractive=payload["extractive"],
-            abstract_summary=payload["abstract"],
-            comments=payload["comments"],
-        )
+        return _to_response(payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/summaries", response_model=List[SummaryInfo])
+async def list_summaries(source: Optional[str] = None, limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """
+    Stored summaries, most recently updated first, optionally only those of `source`.
+    """
+    items = await run_io(SUMMARY_STORE.list, source=source, limit=limit, offset=offset)
+    return [SummaryInfo(summary_id=i["id"], source=i["source"], created=i["created"], updated=i["updated"]) for i in items]
+
+@router.get("/summaries/{summary_id}", response_model=SummarizeResponse)
+async def get_summary(summary_id: str):
+    """
+    A stored summary, without regenerating it.
+    """
+    payload = await run_io(SUMMARY_STORE.get, summary_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"Summary {summary_id} not found")
+    return _to_response(payload)
@@ -0,0 +1,175 @@
+import os
+import time
+import numpy as np
+import faiss
+from typing import List, Dict, Any, Optional
+from app.utils.logger import get_logger
+
+logger = get_logger("ann_index")
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# below this many vectors a brute-force scan is fast enough and needs no training
+TRAIN_THRESHOLD = int(os.getenv("FAISS_TRAIN_THRESHOLD", "20000"))
+TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+NLIST = int(os.getenv("FAISS_NLIST", "0"))  # 0 = derive from corpus size
+PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+ADD_BATCH = 65536
+
+if INDEX_TYPE not in INDEX_TYPES:
+    raise ValueError(f"FAISS_INDEX_TYPE must be one of {INDEX_TYPES}, got {INDEX_TYPE!r}")
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Name of the index family, looking through id-map wrappers."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def target_index_type(n_vectors: int, index_type: str = None) -> str:
+    """The index family the corpus should be served from at its current size."""
+    index_type = index_type or INDEX_TYPE
+    return index_type if n_vectors >= TRAIN_THRESHOLD else "flat"
+
+
+def _nlist(n_vectors: int) -> int:
+    if NLIST:
+        return NLIST
+    # ~4*sqrt(N) lists, with enough points per centroid (faiss warns under 39) to train
+    return int(max(1, min(4 * np.sqrt(n_vectors), n_vectors // 39)))
+
+
+def _pq_m(dim: int) -> int:
+    m = min(PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def has_ids(index: faiss.Index) -> bool:
+    """True for indexes that carry explicit row ids (older snapshots used positions)."""
+    return isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+def index_ids(index: faiss.Index) -> np.ndarray:
+    """Row ids stored in an id-mapped index."""
+    return faiss.vector_to_array(faiss.downcast_index(index).id_map)
+
+
+def make_index(index_type: str, dim: int, n_vectors: int = 0) -> faiss.Index:
+    """
+    Create an empty (possibly untrained) inner-product index of the given family,
+    wrapped in an IndexIDMap2 so rows keep their ids when the index is rebuilt without deleted rows.
+    """
+    return faiss.IndexIDMap2(_make_inner_index(index_type, dim, n_vectors))
+
+
+def _make_inner_index(index_type: str, dim: int, n_vectors: int) -> faiss.Index:
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        spec = f"IVF{_nlist(n_vectors)},Flat"
+    elif index_type == "ivf_pq":
+        spec = f"IVF{_nlist(n_vectors)},PQ{_pq_m(dim)}"
+    elif index_type == "hnsw":
+        spec = f"HNSW{HNSW_M}"
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    return faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+
+
+def build_index(index_type: str, vectors: np.ndarray, ids: np.ndarray = None) -> faiss.Index:
+    """
+    Build a filled index from the rows `ids` of `vectors` (all rows by default;
+    `vectors` may be a read-only memmap of the vector log). Row numbers become the index ids.
+    Training uses a random sample; vectors are added in batches to bound memory.
+    """
+    ids = np.arange(len(vectors), dtype="int64") if ids is None else np.asarray(ids, dtype="int64")
+    n, dim = len(ids), vectors.shape[1]
+    index = make_index(index_type, dim, n)
+    start = time.perf_counter()
+    if not index.is_trained:
+        sample_ids = np.sort(np.random.default_rng(0).choice(ids, size=min(n, TRAIN_SAMPLE), replace=False))
+        index.train(np.ascontiguousarray(vectors[sample_ids], dtype="float32"))
+    for lo in range(0, n, ADD_BATCH):
+        batch = ids[lo:lo + ADD_BATCH]
+        index.add_with_ids(np.ascontiguousarray(vectors[batch], dtype="float32"), batch)
+    logger.info("Built %s index over %d vectors in %.1fs", index_type, n, time.perf_counter() - start)
+    return index
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  sel: faiss.IDSelector = None):
+    """
+    Per-call search parameters, so a request can trade recall for latency
+    without mutating the shared index. `sel` restricts the ids that may be returned.
+    """
+    kind = index_type_of(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or NPROBE, sel=sel)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def recall_report(vectors: np.ndarray, n_queries: int = 200, k: int = 10,
+                  configs: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Measure recall@k and query latency of each ANN config against the exact
+    flat index over the same vectors. Queries are sampled from the corpus.
+    """
+    if configs is None:
+        configs = [{"index_type": "flat"}]
+        configs += [{"index_type": t, "nprobe": p} for t in ("ivf_flat", "ivf_pq") for p in (4, 16, 64)]
+        configs += [{"index_type": "hnsw", "ef_search": ef} for ef in (32, 64, 128)]
+
+    rng = np.random.default_rng(1)
+    query_ids = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = np.ascontiguousarray(vectors[np.sort(query_ids)], dtype="float32")
+
+    built: Dict[str, faiss.Index] = {}
+    build_times: Dict[str, float] = {}
+    truth = None
+    report = []
+    for cfg in configs:
+        index_type = cfg["index_type"]
+        if index_type not in built:
+            start = time.perf_counter()
+            built[index_type] = build_index(index_type, vectors)
+            build_times[index_type] = time.perf_counter() - start
+        index = built[index_type]
+        params = search_params(index, cfg.get("nprobe"), cfg.get("ef_search"))
+
+        latencies = []
+        found = []
+        for q in queries:
+            start = time.perf_counter()
+            _, I = index.search(q.reshape(1, -1), k, params=params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(I[0])
+        found = np.stack(found)
+        if truth is None:
+            truth = found if index_type == "flat" else build_index("flat", vectors).search(queries, k)[1]
+
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        report.append({
+            **cfg,
+            "recall_at_k": round(float(recall), 4),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+            "build_s": round(build_times[index_type], 2),
+        })
+    return report
@@ -0,0 +1,78 @@
+import os
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Any, Dict, List, Optional
+from app.services.executor import PROCESS_WORKERS
+from app.utils.logger import get_logger
+
+logger = get_logger("asr")
+
+ASR_BACKEND = os.getenv("ASR_BACKEND", "openai-whisper")  # "openai-whisper" or "faster-whisper"
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")  # model size (tiny, base, small, medium, large-v3, ...)
+# faster-whisper weights: int8 is the fast choice on CPU; float16 / int8_float16 on GPU
+ASR_COMPUTE_TYPE = os.getenv("ASR_COMPUTE_TYPE", "int8")
+ASR_DEVICE = os.getenv("ASR_DEVICE", "cpu")  # "cpu", "cuda" or "auto"
+
+
+def _threads() -> int:
+    """CPU threads per model: with several worker processes each gets a share of the cores (0 = library default)."""
+    return max(1, (os.cpu_count() or 1) // PROCESS_WORKERS) if PROCESS_WORKERS > 1 else 0
+
+
+class ASRBackend(ABC):
+    """
+    Interface of the speech recognition backends: transcribe 16 kHz mono float32 samples into
+    segments {start, end, text} with times in seconds from the start of the samples.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def transcribe(self, samples: np.ndarray, initial_prompt: Optional[str] = None) -> List[Dict[str, Any]]:
+        ...
+
+
+class OpenAIWhisperBackend(ASRBackend):
+    """The reference openai-whisper implementation (PyTorch, fp32 on CPU)."""
+
+    name = "openai-whisper"
+
+    def __init__(self, model: str = WHISPER_MODEL, device: str = ASR_DEVICE):
+        import torch
+        import whisper
+        if _threads():
+            torch.set_num_threads(_threads())
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = whisper.load_model(model, device=device)
+        self.fp16 = device == "cuda"  # fp16 is not supported on CPU (whisper warns and falls back)
+
+    def transcribe(self, samples: np.ndarray, initial_prompt: Optional[str] = None) -> List[Dict[str, Any]]:
+        result = self.model.transcribe(samples, initial_prompt=initial_prompt, fp16=self.fp16)
+        return [{"start": s["start"], "end": s["end"], "text": s["text"]} for s in result.get("segments", [])]
+
+
+class FasterWhisperBackend(ASRBackend):
+    """faster-whisper: the same models on CTranslate2, quantized (ASR_COMPUTE_TYPE, int8 by default)."""
+
+    name = "faster-whisper"
+
+    def __init__(self, model: str = WHISPER_MODEL, device: str = ASR_DEVICE, compute_type: str = ASR_COMPUTE_TYPE):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model, device=device, compute_type=compute_type, cpu_threads=_threads())
+
+    def transcribe(self, samples: np.ndarray, initial_prompt: Optional[str] = None) -> List[Dict[str, Any]]:
+        segments, _ = self.model.transcribe(samples, initial_prompt=initial_prompt)
+        return [{"start": s.start, "end": s.end, "text": s.text} for s in segments]  # decoding runs while iterating
+
+
+BACKENDS = {backend.name: backend for backend in (OpenAIWhisperBackend, FasterWhisperBackend)}
+
+
+def open_backend(name: str = None, model: str = None, **options) -> ASRBackend:
+    """The backend selected by ASR_BACKEND (or `name`), loaded with WHISPER_MODEL (or `model`)."""
+    name = name or ASR_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"ASR_BACKEND must be one of {sorted(BACKENDS)}, got {name!r}")
+    logger.info("Loading ASR backend %s (%s)", name, model or WHISPER_MODEL)
+    return BACKENDS[name](model or WHISPER_MODEL, **options)
@@ -0,0 +1,62 @@
+import os
+import re
+import math
+from typing import Callable, Dict, Any, Iterator, List
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "384"))  # bge-large truncates its input at 512 tokens
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "64"))
+PAGE_BREAK = "\f"  # parse_pdf separates pages with a form feed
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap token estimate (~1.3 word-piece tokens per word) when no tokenizer is available."""
+    return math.ceil(len(text.split()) * 1.3)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def _split_long(sentence: str, n_tokens: int, max_tokens: int) -> List[str]:
+    """Cut a sentence longer than a whole chunk into roughly equal word windows."""
+    words = sentence.split()
+    n_pieces = math.ceil(n_tokens / max_tokens)
+    size = math.ceil(len(words) / n_pieces)
+    return [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+
+def iter_chunks(text: str, count_tokens: Callable[[str], int] = approx_tokens,
+                max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> Iterator[Dict[str, Any]]:
+    """
+    Split `text` into chunks of at most `max_tokens` tokens, yielded lazily.
+    Chunks end on sentence boundaries and never span a page break; consecutive chunks
+    of a page share up to `overlap` tokens of trailing sentences.
+    Yields {"text", "index", "page"} dicts (page is 1-based).
+    """
+    index = 0
+    for page_no, page in enumerate(text.split(PAGE_BREAK), start=1):
+        window: List[tuple] = []  # (sentence, tokens)
+        window_tokens = 0
+        for sentence in split_sentences(page):
+            n = count_tokens(sentence)
+            pieces = [(sentence, n)] if n <= max_tokens else \
+                [(p, count_tokens(p)) for p in _split_long(sentence, n, max_tokens)]
+            for piece, n in pieces:
+                if window and window_tokens + n > max_tokens:
+                    yield {"text": " ".join(s for s, _ in window), "index": index, "page": page_no}
+                    index += 1
+                    # carry the tail of the previous chunk over as context
+                    carried, carried_tokens = [], 0
+                    for s, t in reversed(window):
+                        if carried_tokens + t > overlap or carried_tokens + t + n > max_tokens:
+                            break
+                        carried.insert(0, (s, t))
+                        carried_tokens += t
+                    window, window_tokens = carried, carried_tokens
+                window.append((piece, n))
+                window_tokens += n
+        if window:
+            yield {"text": " ".join(s for s, _ in window), "index": index, "page": page_no}
+            index += 1
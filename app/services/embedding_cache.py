@@ -0,0 +1,140 @@
+import re
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.utils.db import connect
+from app.utils.logger import get_logger
+
+logger = get_logger("embedding_cache")
+
+# rough per-entry overhead of the key, tuple and OrderedDict node on top of the vector
+_ENTRY_OVERHEAD = 200
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query, so trivial variants share an entry."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha1(f"{model_name}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with a TTL.
+    Memory is accounted in bytes (vector size + fixed overhead) rather than entry count.
+    With `disk_path` set, entries are also written to a SQLite file so the cache survives restarts;
+    a memory miss falls through to disk before the model is called. The file is bounded by
+    `max_disk_bytes`: past it, the entries least recently written or read from disk are evicted
+    down to 90% of the bound.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, disk_path: Optional[str] = None, max_disk_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes or 4 * max_bytes
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0,
+                                      "disk_evictions": 0}
+        self._db = None
+        if disk_path:
+            self._db = connect(disk_path)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB, dtype TEXT, created REAL)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")}
+            if "last_used" not in columns:  # files written before the disk tier was bounded
+                self._db.execute("ALTER TABLE embeddings ADD COLUMN size INTEGER")
+                self._db.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL")
+                self._db.execute("UPDATE embeddings SET size = length(vec) + length(key), last_used = created")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - ttl,))
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk(int(self.max_disk_bytes * 0.9))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vec, created = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return vec
+                self._remove(key)
+                self.stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vec, dtype, created FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[2] <= self.ttl:
+                    vec = np.frombuffer(row[0], dtype=row[1])
+                    self._insert(key, vec, row[2])
+                    self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self.stats["disk_hits"] += 1
+                    return vec
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, vec: np.ndarray):
+        created = time.time()
+        vec = np.array(vec, copy=True)
+        vec.setflags(write=False)
+        with self._lock:
+            self._insert(key, vec, created)
+            if self._db is not None:
+                size = vec.nbytes + len(key)
+                old = self._db.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._db.execute("INSERT OR REPLACE INTO embeddings (key, vec, dtype, created, size, last_used) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", (key, vec.tobytes(), vec.dtype.str, created, size, created))
+                self._disk_bytes += size - (old[0] if old else 0)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk(int(self.max_disk_bytes * 0.9))
+                self._db.commit()
+
+    def _evict_disk(self, target: int):
+        freed, keys = 0, []
+        for key, size in self._db.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            if self._disk_bytes - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+        self._disk_bytes -= freed
+        self.stats["disk_evictions"] += len(keys)
+        logger.info("Evicted %d cached query embeddings from disk (%d bytes)", len(keys), freed)
+
+    def _insert(self, key: str, vec: np.ndarray, created: float):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (vec, created)
+        self._bytes += vec.nbytes + _ENTRY_OVERHEAD
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        vec, _ = self._entries.pop(key)
+        self._bytes -= vec.nbytes + _ENTRY_OVERHEAD
+
+    def info(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes if self._db is not None else 0,
+                "hit_rate": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 4) if lookups else 0.0,
+            }
@@ -1,120 +1,623 @@
 import os
+import re
+import time
+import hashlib
+import threading
 import numpy as np
-from typing import List, Dict, Any, Tuple
-from sentence_transformers import SentenceTransformer
+from collections import defaultdict
+from itertools import islice
+from typing import List, Dict, Any, Tuple, Optional, Set, Iterator
 import faiss
 import json
 from app.utils.logger import get_logger
+from app.utils.rwlock import ReadWriteLock
+from app.services.metadata_store import MetadataStore, ContentHashIndex, RowSet
+from app.services import ann_index
+from app.services.embedding_cache import EmbeddingCache, cache_key
+from app.services.chunking import iter_chunks
+from app.services import model_registry
+from app.services.executor import cpu_limit
 
 logger = get_logger("embeddings_service")
 EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
-INDEX_DIR = r"D:\project\Python\DL(Mostafa saad)\Project\Study-Assistant\data\processed\faiss"
+INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "data/processed/faiss")
 INDEX_FILE = os.path.join(INDEX_DIR, "index.faiss")
-META_FILE = os.path.join(INDEX_DIR, "meta.json")
-EMBED_DIM = None  
+META_FILE = os.path.join(INDEX_DIR, "meta.json")  # legacy JSON metadata, migrated on startup
+# Append-only logs: every ingest appends here, snapshots are rebuilt in the background.
+VECTOR_LOG = os.path.join(INDEX_DIR, "vectors.f32")
+META_LOG = os.path.join(INDEX_DIR, "meta.log.jsonl")  # legacy, migrated on startup
+META_LOG_COMPACTING = META_LOG + ".compacting"
+HASH_FILE = os.path.join(INDEX_DIR, "content.hash")  # row-aligned content digests for dedup
+TOMBSTONE_FILE = os.path.join(INDEX_DIR, "deleted.rows")
+COMPACT_EVERY = int(os.getenv("FAISS_COMPACT_EVERY", "2000"))  # rows appended before a new snapshot
+# rebuild the index without deleted rows once they make up this fraction of it
+COMPACT_DELETED_RATIO = float(os.getenv("FAISS_COMPACT_DELETED_RATIO", "0.1"))
+LOG_FSYNC = os.getenv("FAISS_LOG_FSYNC", "1") == "1"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # chunks embedded and appended per step
+QUERY_CACHE_MAX_MB = float(os.getenv("QUERY_CACHE_MAX_MB", "64"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))  # seconds
+QUERY_CACHE_FILE = os.getenv("QUERY_CACHE_FILE", "")  # e.g. data/processed/query_cache.sqlite, empty = memory only
+QUERY_CACHE_DISK_MAX_MB = float(os.getenv("QUERY_CACHE_DISK_MAX_MB", "256"))
+EMBED_DIM = None  # known once the index or the model is loaded
 
-# Load SentenceTransformer model once
-logger.info("Loading embedding model %s", EMBEDDING_MODEL)
-embed_model = SentenceTransformer(EMBEDDING_MODEL)
-EMBED_DIM = embed_model.get_sentence_embedding_dimension()
-logger.info("Embedding dimension: %d", EMBED_DIM)
 
-_index = None
-_metadata = {} # id -> metadata (text, source, chunk_id, etc.)
+def _load_embed_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+# Loaded on first use (or by the startup warm-up), not at import time
+model_registry.register("embedding", _load_embed_model)
+
+def _embed_model():
+    return model_registry.get("embedding")
+
+_index = None  # IndexIDMap2: FAISS ids are row ids in the logs, stable across rebuilds
+_meta_store: MetadataStore = None # row id -> metadata (text, source, chunk_id, etc.)
+_hash_index: ContentHashIndex = None # content digest -> row id
+_key_store: MetadataStore = None # row id -> {doc_id, source}, small enough to scan for the doc maps
+_tombstones: RowSet = None # deleted row ids
+_deleted_in_index: Set[int] = set()  # tombstoned rows the live index still contains
+_delete_selector = None  # faiss selector excluding _deleted_in_index at search time
+_doc_rows: Optional[Dict[str, Set[int]]] = None  # doc_id -> rows, built on first delete
+_source_rows: Optional[Dict[str, Set[int]]] = None  # source -> rows
+_lock = threading.RLock()  # serializes writers: ingest, delete, snapshots, rebuilds
+# searches share the live index; only add_with_ids and swapping in a rebuilt index exclude them
+_index_lock = ReadWriteLock()
+_log_rows = 0  # rows in the vector log
+_pending_rows = 0  # rows in the logs that are not covered by the snapshot yet
+_compacting = False
+_retraining = False
+_query_cache = EmbeddingCache(int(QUERY_CACHE_MAX_MB * 1024 * 1024), QUERY_CACHE_TTL, QUERY_CACHE_FILE or None,
+                              int(QUERY_CACHE_DISK_MAX_MB * 1024 * 1024))
 
 def _init_index():
-    global _index, _metadata
+    global _index, _meta_store, _hash_index, _key_store, _tombstones, EMBED_DIM
     if _index is not None:
         return _index
 
-    if os.path.exists(INDEX_FILE) and os.path.exists(META_FILE):
-        try:
-            logger.info("Loading FAISS index from %s", INDEX_FILE)
-            _index = faiss.read_index(INDEX_FILE)
-            with open(META_FILE, "r", encoding="utf-8") as f:
-                _metadata = json.load(f)
+    with _lock:
+        if _index is not None:
             return _index
-        except Exception as e:
-            logger.warning("Failed to load existing index: %s. Creating new index.", e)
-    
-    logger.info("Creating new FAISS index (IndexFlatIP)")
-    _index = faiss.IndexFlatIP(EMBED_DIM)
-    _metadata = {}
-    return _index
+
+        _meta_store = MetadataStore(INDEX_DIR)
+        _hash_index = ContentHashIndex(HASH_FILE)
+        _key_store = MetadataStore(INDEX_DIR, name="doc_keys")
+        _tombstones = RowSet(TOMBSTONE_FILE)
+        if os.path.exists(INDEX_FILE):
+            try:
+                logger.info("Loading FAISS index from %s", INDEX_FILE)
+                _index = faiss.read_index(INDEX_FILE)
+            except Exception as e:
+                logger.warning("Failed to load existing index: %s. Creating new index.", e)
+                _index = None
+
+        if _index is not None:
+            EMBED_DIM = _index.d
+        else:
+            EMBED_DIM = _embed_model().get_sentence_embedding_dimension()
+            logger.info("Creating new FAISS index (IndexFlatIP)")
+            _index = ann_index.make_index("flat", EMBED_DIM)
+
+        _migrate_json_metadata()
+        _replay_logs()
+        _backfill_hashes()
+        _backfill_doc_keys()
+        _maybe_retrain()
+        return _index
+
+def _migrate_json_metadata():
+    """
+    Move metadata written by older versions (meta.json plus its append log)
+    into the binary store, once, in row order.
+    """
+    legacy = [p for p in (META_FILE, META_LOG_COMPACTING, META_LOG) if os.path.exists(p)]
+    if not legacy or len(_meta_store) > 0:
+        return
+    metadata = {}
+    if os.path.exists(META_FILE):
+        with open(META_FILE, "r", encoding="utf-8") as f:
+            metadata = {int(row): md for row, md in json.load(f).items()}
+    for path in (META_LOG_COMPACTING, META_LOG):
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                metadata[int(record["row"])] = record["md"]
+    n_rows = max(metadata) + 1 if metadata else 0
+    _meta_store.append([metadata.get(row) for row in range(n_rows)])
+    for path in legacy:
+        os.replace(path, path + ".migrated")
+    logger.info("Migrated %d metadata rows from %s", n_rows, META_FILE)
+
+def _backfill_hashes():
+    """Stores written before content hashing existed get their digests computed once."""
+    if len(_hash_index) >= len(_meta_store):
+        return
+    start = len(_hash_index)
+    logger.info("Hashing %d existing rows for deduplication", len(_meta_store) - start)
+    records = _meta_store.get_many(range(start, len(_meta_store)))
+    _hash_index.append([content_hash(md["text"]) if md else None for md in records])
+
+def _backfill_doc_keys():
+    """Stores written before the doc_id/source side index existed get it filled in once."""
+    if len(_key_store) >= len(_meta_store):
+        return
+    start = len(_key_store)
+    logger.info("Indexing doc ids and sources of %d existing rows", len(_meta_store) - start)
+    records = _meta_store.get_many(range(start, len(_meta_store)))
+    _key_store.append([_doc_keys(md) if md else None for md in records])
+
+def _row_bytes() -> int:
+    return EMBED_DIM * np.dtype("float32").itemsize
+
+def _bootstrap_vector_log():
+    """
+    Indexes saved before the vector log existed only live in `index.faiss`.
+    Seed the log from the flat index so later replays line up row for row.
+    """
+    if ann_index.has_ids(_index):
+        return
+    logged = os.path.getsize(VECTOR_LOG) // _row_bytes() if os.path.exists(VECTOR_LOG) else 0
+    if logged >= _index.ntotal:
+        return
+    if ann_index.index_type_of(_index) != "flat":
+        logger.warning("Cannot seed the vector log from a %s index; retraining will be unavailable",
+                       ann_index.index_type_of(_index))
+        return
+    logger.info("Seeding vector log with %d rows from snapshot", _index.ntotal - logged)
+    vectors = _index.reconstruct_n(logged, _index.ntotal - logged).astype("float32")
+    _append_vectors(vectors)
+
+def _replay_logs():
+    """
+    Crash recovery: add every vector appended to the log after the last snapshot.
+    Metadata rows past the end of the vector log belong to an ingest that crashed
+    before its vectors were written and are dropped.
+    """
+    global _index, _pending_rows, _log_rows
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    _bootstrap_vector_log()
+    row_bytes = _row_bytes()
+    size = os.path.getsize(VECTOR_LOG) if os.path.exists(VECTOR_LOG) else 0
+    n_rows = size // row_bytes
+    if size % row_bytes:
+        logger.warning("Truncating partial vector row at the end of %s", VECTOR_LOG)
+        with open(VECTOR_LOG, "r+b") as f:
+            f.truncate(n_rows * row_bytes)
+    _log_rows = n_rows
+
+    if not ann_index.has_ids(_index):
+        # snapshots from before stable ids addressed rows by position
+        logger.info("Rebuilding positional FAISS index with row ids")
+        covered = _index.ntotal
+        _index = ann_index.build_index(ann_index.index_type_of(_index), _read_vectors(0, n_rows), np.arange(covered))
+        _schedule_compaction()
+    ids = ann_index.index_ids(_index)
+    # rows deleted and compacted away are not in the snapshot, but stay in the tombstones
+    covered = int(ids.max()) + 1 if len(ids) else 0
+    replay = np.array([r for r in range(covered, n_rows) if r not in _tombstones], dtype="int64")
+    if len(replay):
+        vectors = np.ascontiguousarray(_read_vectors(0, n_rows)[replay])
+        with _index_lock.write():
+            _index.add_with_ids(vectors, replay)
+        logger.info("Replayed %d rows from %s", len(replay), VECTOR_LOG)
+    _meta_store.truncate(n_rows)
+    _hash_index.truncate(n_rows)
+    _key_store.truncate(n_rows)
+    _set_deleted_in_index({int(r) for r in ids if int(r) in _tombstones})
+    _pending_rows = n_rows - covered
+    if _pending_rows >= COMPACT_EVERY:
+        _schedule_compaction()
+
+def _set_deleted_in_index(rows: Set[int]):
+    global _deleted_in_index, _delete_selector
+    _deleted_in_index = rows
+    if rows:
+        batch = faiss.IDSelectorBatch(np.array(sorted(rows), dtype="int64"))
+        _delete_selector = faiss.IDSelectorNot(batch)
+        _delete_selector.referenced_batch = batch  # keep the wrapped selector alive
+    else:
+        _delete_selector = None
+
+def _read_vectors(start: int, stop: int) -> np.ndarray:
+    """Read-only view of rows [start, stop) of the vector log."""
+    if stop <= start:
+        return np.empty((0, EMBED_DIM), dtype="float32")
+    return np.memmap(VECTOR_LOG, dtype="float32", mode="r", offset=start * _row_bytes(), shape=(stop - start, EMBED_DIM))
+
+def _sync(f):
+    f.flush()
+    if LOG_FSYNC:
+        os.fsync(f.fileno())
+
+def _append_vectors(vectors: np.ndarray):
+    with open(VECTOR_LOG, "ab") as f:
+        f.write(np.ascontiguousarray(vectors, dtype="float32").tobytes())
+        _sync(f)
+
+def _append_logs(vectors: np.ndarray, records: List[Dict[str, Any]], digests: List[bytes]) -> np.ndarray:
+    """
+    Metadata and digests are appended before the vectors: a crash in between leaves
+    rows without vectors, which recovery truncates. Returns the new row ids.
+    """
+    global _log_rows
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    first = _meta_store.append(records, fsync=LOG_FSYNC)
+    _hash_index.append(digests, fsync=LOG_FSYNC)
+    _key_store.append([_doc_keys(md) for md in records], fsync=LOG_FSYNC)
+    _append_vectors(vectors)
+    _log_rows = first + len(records)
+    return np.arange(first, _log_rows, dtype="int64")
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _schedule_compaction():
+    global _compacting
+    with _lock:
+        if _compacting:
+            return
+        _compacting = True
+    threading.Thread(target=_compact, name="faiss-compaction", daemon=True).start()
+
+def _compact():
+    """
+    Fold the vector log into a fresh index snapshot. Only the in-memory copy
+    happens under the lock; writing it out runs while ingest keeps appending.
+    """
+    global _pending_rows, _compacting
+    try:
+        with _lock:
+            blob = faiss.serialize_index(_index)
+            ntotal = _index.ntotal
+            _pending_rows = 0
+
+        _write_atomic(INDEX_FILE, blob.tobytes())
+        logger.info("Compacted FAISS index snapshot (%d rows)", ntotal)
+    except Exception as e:
+        logger.warning("Failed to compact index: %s", e)
+    finally:
+        _compacting = False
 
 def _save_index():
-    global _index, _metadata
+    """Force a snapshot now (blocking), e.g. before shutting down."""
+    global _compacting
     if _index is None:
         return
+    with _lock:
+        if _compacting:
+            return
+        _compacting = True
+    _compact()
+
+def _maybe_retrain():
+    """
+    Start a background rebuild when the live index family no longer matches
+    the configured one for the current corpus size (e.g. flat -> IVF once the
+    corpus crosses FAISS_TRAIN_THRESHOLD, or after FAISS_INDEX_TYPE changed),
+    or when deleted rows make up more than FAISS_COMPACT_DELETED_RATIO of it.
+    """
+    global _retraining
+    current = ann_index.index_type_of(_index)
+    target = ann_index.target_index_type(_index.ntotal - len(_deleted_in_index))
+    too_many_deleted = len(_deleted_in_index) > COMPACT_DELETED_RATIO * max(_index.ntotal, 1)
+    if current == target and not too_many_deleted:
+        return
+    with _lock:
+        if _retraining:
+            return
+        _retraining = True
+    threading.Thread(target=_retrain, args=(target,), name="faiss-retrain", daemon=True).start()
+
+def _retrain(index_type: str):
+    """
+    Build the new index from the live rows of the vector log without holding
+    the lock, then catch up on rows ingested or deleted meanwhile and swap it in.
+    """
+    global _index, _retraining
     try:
-        os.makedirs(INDEX_DIR, exist_ok=True)
-        faiss.write_index(_index, INDEX_FILE)
-        with open(META_FILE, "w", encoding="utf-8") as f:
-            json.dump(_metadata, f, ensure_ascii=False, indent=2)
-        logger.info("Saved FAISS index and metadata")
+        with _lock:
+            n_rows = _log_rows
+            excluded = set(_tombstones)
+        live = np.array([r for r in range(n_rows) if r not in excluded], dtype="int64")
+        logger.info("Rebuilding FAISS index as %s over %d vectors (%d deleted dropped)", index_type, len(live), len(excluded))
+        new_index = ann_index.build_index(index_type, _read_vectors(0, n_rows), live)
+        with _lock:
+            caught_up = np.empty(0, dtype="int64")
+            if _log_rows > n_rows:
+                caught_up = np.array([r for r in range(n_rows, _log_rows) if r not in _tombstones], dtype="int64")
+                if len(caught_up):
+                    new_index.add_with_ids(np.ascontiguousarray(_read_vectors(0, _log_rows)[caught_up]), caught_up)
+            # rows deleted during the rebuild: only those the new index actually contains
+            in_index = set(live.tolist()) | set(caught_up.tolist())
+            with _index_lock.write():
+                _index = new_index
+                _set_deleted_in_index({r for r in _tombstones if r in in_index})
+        while _compacting:
+            time.sleep(0.1)
+        _save_index()
     except Exception as e:
-        logger.warning("Failed to save index: %s", e)
+        logger.warning("Failed to rebuild index as %s: %s", index_type, e)
+    finally:
+        _retraining = False
 
 def embed_texts(texts: List[str]) -> List[np.ndarray]:
     """Return L2-normalized embeddings for a list of texts."""
     #logger.info(f"Loaded HuggingFace model: {os.getenv('HF_MODEL_NAME', 'all-MiniLM-L6-v2')}")
-    embeddings = embed_model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    model = _embed_model()
+    with cpu_limit():
+        embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
     norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
     norms[norms == 0] = 1.0
     embeddings = embeddings / norms
     return embeddings
 
 
-def add_documents(docs: List[Dict[str, Any]]) -> List[str]:
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """
+    `embed_texts` for search queries, behind the query-embedding cache.
+    Only the cache misses are encoded, in a single batch.
+    """
+    keys = [cache_key(EMBEDDING_MODEL, q) for q in queries]
+    found = {}
+    missing = {}  # key -> query text, duplicates in the batch are encoded once
+    for key, query in zip(keys, queries):
+        if key in found or key in missing:
+            continue
+        vec = _query_cache.get(key)
+        if vec is None:
+            missing[key] = query
+        else:
+            found[key] = vec
+    if missing:
+        fresh = embed_texts(texts=list(missing.values())).astype("float32")
+        for key, vec in zip(missing, fresh):
+            _query_cache.put(key, vec)
+            found[key] = vec
+    return np.stack([found[key] for key in keys]).astype("float32")
+
+def get_query_cache_stats() -> Dict[str, Any]:
+    return _query_cache.info()
+
+
+def content_hash(text: str) -> bytes:
+    """Digest of the whitespace-normalized text, used to detect duplicate chunks."""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=ContentHashIndex.DIGEST_SIZE).digest()
+
+def _count_tokens(text: str) -> int:
+    return len(_embed_model().tokenizer.tokenize(text))
+
+def _iter_chunk_docs(docs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Split every doc into token-sized chunks; chunk ids are '<doc_id>#<n>'."""
+    for doc in docs:
+        for chunk in iter_chunks(doc["text"], count_tokens=_count_tokens):
+            yield {**doc, "chunk_id": f"{doc['id']}#{chunk['index']}", "text": chunk["text"],
+                   "chunk_index": chunk["index"], "page": chunk["page"]}
+
+def _doc_record(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    return {"doc_id": chunk["id"], "chunk_id": chunk["chunk_id"], "chunk_index": chunk["chunk_index"],
+            "page": chunk["page"], "source": chunk.get("source"), "text": chunk["text"], "meta": chunk.get("meta", {})}
+
+def _doc_keys(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {"doc_id": record["doc_id"], "source": record.get("source")}
+
+def add_documents(docs: List[Dict[str, Any]], on_duplicate: str = "skip") -> Tuple[List[str], List[str]]:
     """
     Add docs: each doc = {'id': str, 'text': str, 'source': str, 'meta': {...}}
-    Returns list of doc ids added.
+    Each doc is split into token-sized chunks (linked to it by doc_id), which are
+    embedded and appended EMBED_BATCH_SIZE at a time.
+    Chunks whose text is already indexed are not embedded again: with on_duplicate="skip"
+    they are ignored, with "upsert" the existing row takes their id, source and meta.
+    Returns (chunk ids added, chunk ids skipped as duplicates).
     """    
-    global _index, _metadata
+    if on_duplicate not in ("skip", "upsert"):
+        raise ValueError(f"on_duplicate must be 'skip' or 'upsert', got {on_duplicate!r}")
+    _init_index()
+
+    added, duplicates = [], []
+    chunks = _iter_chunk_docs(docs)
+    while True:
+        batch = list(islice(chunks, EMBED_BATCH_SIZE))
+        if not batch:
+            break
+        batch_added, batch_duplicates = _add_chunks(batch, on_duplicate)
+        added += batch_added
+        duplicates += batch_duplicates
+    _maybe_retrain()
+    logger.info("Added %d chunks from %d documents to index (%d duplicates %s)", len(added), len(docs),
+                len(duplicates), "upserted" if on_duplicate == "upsert" else "skipped")
+    return added, duplicates
+
+def _add_chunks(chunks: List[Dict[str, Any]], on_duplicate: str) -> Tuple[List[str], List[str]]:
+    global _pending_rows
+    new, duplicates = [], []
+    seen = set()
+    for chunk in chunks:
+        digest = content_hash(chunk["text"])
+        if digest in seen or _hash_index.get(digest) is not None:
+            duplicates.append((chunk, digest))
+        else:
+            seen.add(digest)
+            new.append((chunk, digest))
+
+    embeds = embed_texts(texts=[chunk["text"] for chunk, _ in new]).astype("float32") if new else None
+    with _lock:
+        # a concurrent ingest may have indexed the same text while we were embedding
+        keep = [i for i, (_, digest) in enumerate(new) if _hash_index.get(digest) is None]
+        duplicates += [new[i] for i in sorted(set(range(len(new))) - set(keep))]
+        added = [new[i] for i in keep]
+        if added:
+            vectors = embeds[keep]
+            records = [_doc_record(chunk) for chunk, _ in added]
+            rows = _append_logs(vectors, records, [digest for _, digest in added])
+            with _index_lock.write():  # the logs are synced before searches are held back
+                _index.add_with_ids(vectors, rows)
+            _pending_rows += len(added)
+            for row, record in zip(rows.tolist(), records):
+                _track_row(row, record)
+        if on_duplicate == "upsert":
+            for chunk, digest in duplicates:
+                row = _hash_index.get(digest)
+                record = _doc_record(chunk)
+                _untrack_row(row, _key_store.get(row))
+                _meta_store.update(row, record, fsync=LOG_FSYNC)
+                _key_store.update(row, _doc_keys(record), fsync=LOG_FSYNC)
+                _track_row(row, record)
+        if _pending_rows >= COMPACT_EVERY:
+            _schedule_compaction()
+    return [chunk["chunk_id"] for chunk, _ in added], [chunk["chunk_id"] for chunk, _ in duplicates]
+
+
+def _ensure_doc_maps():
+    """
+    doc_id/source -> rows lookups, built on first use from the doc key store
+    (chunk text and metadata are not decoded).
+    """
+    global _doc_rows, _source_rows
+    if _doc_rows is not None:
+        return
+    _doc_rows, _source_rows = defaultdict(set), defaultdict(set)
+    for row in range(len(_key_store)):
+        if row not in _tombstones:
+            _track_row(row, _key_store.get(row))
+
+def _track_row(row: int, md: Optional[Dict[str, Any]]):
+    if _doc_rows is None or md is None:
+        return
+    _doc_rows[md["doc_id"]].add(row)
+    _source_rows[md.get("source")].add(row)
+
+def _untrack_row(row: int, md: Optional[Dict[str, Any]]):
+    if _doc_rows is None or md is None:
+        return
+    _doc_rows[md["doc_id"]].discard(row)
+    _source_rows[md.get("source")].discard(row)
+
+def delete_documents(doc_ids: List[str] = None, source: str = None) -> int:
+    """
+    Delete every row of the given doc ids and/or source. Rows are tombstoned
+    (filtered out of searches immediately) and dropped from the index by a
+    background rebuild once enough have accumulated. Returns the number of rows deleted.
+    """
     _init_index()
-    texts = [d["text"] for d in docs]
-    ids = [d["id"] for d in docs]
-    
-    embeds = embed_texts(texts=texts)
-    start_idx = _index.ntotal
-    _index.add(embeds)
-    for i, doc_id  in enumerate(ids):
-        idx = start_idx + i
-        _metadata[str(idx)] = {"doc_id": doc_id, "source": docs[i].get("source"), "text": docs[i]["text"], "meta": docs[i].get("meta", {})}
-    _save_index()
-    logger.info("Added %d documents to index", len(docs))
-    return ids
-
-
-def search(query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+    with _lock:
+        _ensure_doc_maps()
+        rows = set()
+        for doc_id in doc_ids or []:
+            rows |= _doc_rows.get(doc_id, set())
+        if source is not None:
+            rows |= _source_rows.get(source, set())
+        rows = sorted(r for r in rows if r not in _tombstones)
+        if not rows:
+            return 0
+        _tombstones.add(rows, fsync=LOG_FSYNC)
+        _hash_index.clear(rows, fsync=LOG_FSYNC)
+        for row in rows:
+            _untrack_row(row, _key_store.get(row))
+        _set_deleted_in_index(_deleted_in_index | set(rows))
+    _maybe_retrain()
+    logger.info("Deleted %d rows (doc_ids=%s, source=%s)", len(rows), doc_ids, source)
+    return len(rows)
+
+def upsert_documents(docs: List[Dict[str, Any]]) -> Tuple[List[str], int]:
+    """
+    Replace documents by id: existing rows of each doc id are deleted, then the docs are added.
+    Returns (chunk ids added, number of rows replaced).
+    """
+    replaced = delete_documents(doc_ids=[d["id"] for d in docs])
+    added, _ = add_documents(docs)
+    return added, replaced
+
+
+def search(query: str, k: int = 5, nprobe: int = None, ef_search: int = None) -> List[Tuple[float, Dict[str, Any]]]:
     """
     Search for top-k passages for `query`.
+    `nprobe` (IVF) and `ef_search` (HNSW) override the configured recall/latency trade-off.
     Returns list of (score, metadata) sorted by descending score.
     """
-    
-    global _index, _metadata
-    
+    return search_many([query], k, nprobe=nprobe, ef_search=ef_search)[0]
+
+
+def search_many(queries: List[str], k: int = 5, nprobe: int = None, ef_search: int = None) -> List[List[Tuple[float, Dict[str, Any]]]]:
+    """
+    Batched `search`: one encode call for all queries and one matrix FAISS search.
+    Returns one result list per query, in the order of `queries`.
+    """
     _init_index()
-    q_emb = embed_texts(texts=[query])[0].astype("float32")
-    if _index.ntotal == 0:
+    if not queries:
         return []
-    q_emb = np.expand_dims(q_emb, axis=0)
-    D, I = _index.search(q_emb.reshape(1, -1), k)
-    scores = D[0].tolist()
-    idxs = I[0].tolist()
-    results = []
-    
-    for score, idx in zip(scores, idxs):
-        if idx < 0:
-            continue
-        md = _metadata.get(str(idx), None)
-        if md is None:
-            continue
-        
-        results.append((float(score), md))
+    q_embs = embed_queries(queries)
+    # FAISS allows concurrent searches but not a search concurrent with add_with_ids
+    with _index_lock.read():
+        index = _index
+        if index.ntotal == 0:
+            return [[] for _ in queries]
+        params = ann_index.search_params(index, nprobe=nprobe, ef_search=ef_search, sel=_delete_selector)
+        D, I = index.search(q_embs, k, params=params)
+    all_results = []
+    for scores, idxs in zip(D.tolist(), I.tolist()):
+        results = []
+        for score, idx in zip(scores, idxs):
+            if idx < 0 or idx in _tombstones:
+                continue
+            md = _meta_store.get(idx)
+            if md is None:
+                continue
+            
+            results.append((float(score), md))
+        all_results.append(results) #sorted by score desending
         
-    return results #sorted by score desending
+    return all_results
+
+def get_source_chunks(source: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Live chunks of `source` in row order, with their embeddings read back from the
+    vector log (nothing is re-encoded). Returns (metadata list, vectors).
+    """
+    _init_index()
+    with _lock:
+        _ensure_doc_maps()
+        rows = sorted(r for r in _source_rows.get(source, ()) if r not in _tombstones)
+        n_rows = _log_rows
+    if not rows:
+        return [], np.empty((0, EMBED_DIM), dtype="float32")
+    vectors = np.array(_read_vectors(0, n_rows)[rows], dtype="float32")
+    return _meta_store.get_many(rows), vectors
+
+
+def mmr_select(vectors: np.ndarray, k: int, lambda_: float = 0.7, query: np.ndarray = None) -> List[int]:
+    """
+    Maximal marginal relevance over L2-normalized `vectors`: k row positions, each picked for
+    relevance to `query` (default the centroid, i.e. how central a chunk is to the whole)
+    minus its similarity to the rows already picked. Returned in selection order.
+    """
+    k = min(k, len(vectors))
+    if k <= 0:
+        return []
+    if query is None:
+        query = vectors.mean(axis=0)
+    query = query / (np.linalg.norm(query) or 1.0)
+    relevance = vectors @ query
+    picked = [int(np.argmax(relevance))]
+    redundancy = vectors @ vectors[picked[0]]
+    while len(picked) < k:
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return picked
 
 def get_index_size()->int:
     _init_index()
-    return _index.ntotal
+    return _index.ntotal - len(_deleted_in_index)
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List
+from app.utils.logger import get_logger
+
+logger = get_logger("executor")
+
+# blocking I/O: Ollama HTTP calls, ffmpeg, request handlers that mostly wait on those
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+# CPU-bound work that must share in-process state (embedding model, FAISS index): threads, since
+# torch and faiss release the GIL; CPU_WORKERS also caps concurrent encodes from any thread
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+# Whisper transcription: separate processes, each holding its own model (0 = run on CPU threads)
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", "1"))
+
+
+class _Pool:
+    """An executor plus the counters exposed on /health."""
+
+    def __init__(self, name: str, workers: int, factory: Callable[[], Executor]):
+        self.name = name
+        self.workers = workers
+        self._factory = factory
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0  # submitted and not finished yet
+        self.completed = 0
+        self.failed = 0
+
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+            return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            result = await loop.run_in_executor(self.executor(), partial(fn, *args, **kwargs))
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, int]:
+        active = min(self.pending, self.workers)
+        return {"workers": self.workers, "active": active, "queued": self.pending - active,
+                "completed": self.completed, "failed": self.failed}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_io = _Pool("io", IO_WORKERS, lambda: ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io"))
+_cpu = _Pool("cpu", CPU_WORKERS, lambda: ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix="cpu"))
+_process_initializer = None  # run by each worker process before its first task
+# spawn, not fork: the parent already runs threads (warm-up, pools) and may hold torch state
+_process = _Pool("process", PROCESS_WORKERS,
+                 lambda: ProcessPoolExecutor(PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_process_initializer))
+_cpu_slots = threading.BoundedSemaphore(CPU_WORKERS)
+_cpu_waiting = 0
+_cpu_waiting_lock = threading.Lock()
+
+
+async def run_io(fn: Callable, *args, **kwargs) -> Any:
+    """Run blocking I/O-bound `fn` off the event loop."""
+    return await _io.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    """Run CPU-bound `fn` that needs this process's state on the bounded CPU thread pool."""
+    return await _cpu.run(fn, *args, **kwargs)
+
+
+async def run_process(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run `fn` (a picklable module-level function) in the worker process pool.
+    Falls back to the CPU thread pool when PROCESS_WORKERS is 0.
+    """
+    if PROCESS_WORKERS <= 0:
+        return await run_cpu(fn, *args, **kwargs)
+    return await _process.run(fn, *args, **kwargs)
+
+
+def set_process_initializer(fn: Callable[[], None]):
+    """Set the function (picklable, module-level) each worker process runs when it starts."""
+    global _process_initializer
+    _process_initializer = fn
+
+
+def warm_process_pool(fn: Callable[[], Any]) -> List[Any]:
+    """
+    Start every worker process now rather than on the first task (blocking; call it from a
+    background thread) and return `fn()` as run in the workers, one call per worker.
+    """
+    pool = _process.executor()
+    return [f.result() for f in [pool.submit(fn) for _ in range(PROCESS_WORKERS)]]
+
+
+@contextmanager
+def cpu_limit():
+    """
+    Hold one of CPU_WORKERS slots for the duration of a CPU-heavy step, whichever
+    thread it runs on (e.g. query encoding inside a request handled on the I/O pool).
+    """
+    global _cpu_waiting
+    with _cpu_waiting_lock:
+        _cpu_waiting += 1
+    _cpu_slots.acquire()
+    with _cpu_waiting_lock:
+        _cpu_waiting -= 1
+    try:
+        yield
+    finally:
+        _cpu_slots.release()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "io": _io.stats(),
+        "cpu": {**_cpu.stats(), "waiting_for_slot": _cpu_waiting},
+        "process": _process.stats() if PROCESS_WORKERS > 0 else {"workers": 0},
+    }
+
+
+def shutdown():
+    for pool in (_io, _cpu, _process):
+        pool.shutdown()
@@ -0,0 +1,118 @@
+import re
+import json
+from typing import Any, List, Optional
+
+
+class Fragment(str):
+    """Text of an array element that did not parse, kept for a targeted repair."""
+
+
+class JSONItemStream:
+    """
+    Pulls the elements of a JSON array out of model output incrementally, as text arrives.
+    The array may be top-level or the value of `key` in an object; prose, markdown fences and
+    anything after the array are ignored. An element that does not parse becomes a `Fragment`
+    instead of failing the whole output, and a truncated final element is reported by `close`.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self.found = False  # saw the opening bracket of the array
+        self.finished = False  # saw its closing bracket
+        self._buf = ""
+        self._pos = 0
+        self._start: Optional[int] = None  # where the current element begins
+        self._depth = 0  # bracket nesting inside the current element
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Add output text; returns the elements (values or Fragments) completed by it."""
+        self._buf += text
+        out: List[Any] = []
+        if not self.found and not self._find_array():
+            return out
+        buf = self._buf
+        while self._pos < len(buf) and not self.finished:
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+                self._begin()
+            elif ch in "[{":
+                self._begin()
+                self._depth += 1
+            elif ch in "]}" and self._depth > 0:
+                self._depth -= 1
+            elif ch == "]":
+                self._end(out)
+                self.finished = True
+            elif ch == "," and self._depth == 0:
+                self._end(out)
+            elif not ch.isspace():
+                self._begin()  # scalar element, or a stray "}" that makes the element invalid
+            self._pos += 1
+        return out
+
+    def close(self) -> List[Any]:
+        """End of output: an unterminated last element (truncated generation) becomes a Fragment."""
+        out: List[Any] = []
+        if self.found and not self.finished:
+            self._end(out)
+        return out
+
+    def _find_array(self) -> bool:
+        if self.key is None:
+            start = self._buf.find("[")
+            start = None if start < 0 else start + 1
+        else:
+            match = re.search(r'"%s"\s*:\s*\[' % re.escape(self.key), self._buf)
+            start = match.end() if match else None
+        if start is None:
+            return False
+        self.found = True
+        self._pos = start
+        return True
+
+    def _begin(self):
+        if self._start is None:
+            self._start = self._pos
+
+    def _end(self, out: List[Any]):
+        if self._start is not None:
+            text = self._buf[self._start:self._pos].strip()
+            try:
+                out.append(json.loads(text))
+            except ValueError:
+                out.append(Fragment(text))
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+
+def salvage_items(raw: str, key: Optional[str] = None) -> List[Any]:
+    """
+    Elements of the JSON array in `raw`, in order, with unparseable ones as Fragments.
+    Falls back to the first array anywhere when `key` is missing; with no array at all
+    the whole output is returned as a single Fragment.
+    """
+    stream = JSONItemStream(key)
+    items = stream.feed(raw) + stream.close()
+    if not stream.found and key is not None:
+        return salvage_items(raw)
+    if not stream.found:
+        return [Fragment(raw.strip())] if raw.strip() else []
+    return items
+
+
+def require_array(raw: str):
+    """Raise ValueError unless `raw` contains an array to salvage from (used to decide whether to cache it)."""
+    if "[" not in raw:
+        raise ValueError("No JSON array in model output")
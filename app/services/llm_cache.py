@@ -0,0 +1,87 @@
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from app.utils.db import connect
+from app.utils.logger import get_logger
+
+logger = get_logger("llm_cache")
+
+
+def response_key(model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """Content address of a generation: identical model, prompt and options share one entry."""
+    payload = json.dumps({"model": model, "prompt": prompt, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of LLM responses in a SQLite file, bounded in bytes.
+    When the bound is exceeded the least recently used entries are evicted down to 90% of it.
+    Safe to share between threads; the WAL journal lets several server processes use one file.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "evictions": 0}
+        self._db = connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, "
+                         "size INTEGER, created REAL, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def record_bypass(self):
+        """Count a lookup skipped on the caller's request (fresh generation forced)."""
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def put(self, key: str, response: str):
+        size = len(response.encode("utf-8")) + len(key)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, response, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+            self.stats["writes"] += 1
+            if self._bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self._db.commit()
+
+    def _evict(self, target: int):
+        freed, keys = 0, []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if self._bytes - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self._bytes -= freed
+        self.stats["evictions"] += len(keys)
+        logger.info("Evicted %d cached LLM responses (%d bytes)", len(keys), freed)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional, Union
+import httpx
+from app.utils.logger import get_logger
+
+logger = get_logger("llm_client")
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# a non-streamed generation sends nothing until it is done, so the read timeout bounds the whole generation
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("OLLAMA_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("OLLAMA_BACKOFF_MAX", "8"))
+# generations Ollama runs at once (match OLLAMA_NUM_PARALLEL on the host); extra calls wait here
+MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps the model loaded between calls
+# constrained output for JSON prompts: "schema" (Ollama >= 0.5), "json" (any JSON object) or "none"
+JSON_FORMAT = os.getenv("OLLAMA_JSON_FORMAT", "schema")
+
+GENERATE_PATH = "/api/generate"
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_LATENCY_WINDOW = 1000
+
+
+class LLMError(RuntimeError):
+    """Raised when a generation fails for good (non-retryable error or retries exhausted)."""
+
+
+_limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+# one limit shared by sync and async callers, so the total in flight never exceeds MAX_CONCURRENCY
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+# async callers wait for a slot on these threads, never on the loop's default executor
+_slot_waiters = ThreadPoolExecutor(MAX_CONCURRENCY, thread_name_prefix="ollama-slot")
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {"calls": 0, "failed": 0, "retries": 0, "in_flight": 0, "waiting": 0,
+                          "prompt_tokens": 0, "completion_tokens": 0, "generation_seconds": 0.0}
+_latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+_first_token: deque = deque(maxlen=_LATENCY_WINDOW)  # streamed calls only
+
+
+def _timeout(read_timeout: Optional[float]) -> httpx.Timeout:
+    return httpx.Timeout(connect=CONNECT_TIMEOUT, read=read_timeout or READ_TIMEOUT, write=30.0, pool=None)
+
+
+def client() -> httpx.Client:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(base_url=OLLAMA_URL, limits=_limits, timeout=_timeout(None))
+        return _client
+
+
+def async_client() -> httpx.AsyncClient:
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = httpx.AsyncClient(base_url=OLLAMA_URL, limits=_limits, timeout=_timeout(None))
+        return _async_client
+
+
+def json_format(schema: Dict[str, Any]) -> Optional[Union[str, Dict[str, Any]]]:
+    """The `response_format` to request JSON matching `schema`, as allowed by OLLAMA_JSON_FORMAT."""
+    if JSON_FORMAT == "schema":
+        return schema
+    if JSON_FORMAT == "json":
+        return "json"
+    return None
+
+
+def _payload(prompt: str, model: Optional[str], options: Optional[Dict[str, Any]],
+             response_format: Optional[Union[str, Dict[str, Any]]] = None, stream: bool = False) -> Dict[str, Any]:
+    payload = {"model": model or OLLAMA_MODEL, "prompt": prompt, "stream": stream, "keep_alive": KEEP_ALIVE}
+    if options:
+        payload["options"] = options
+    if response_format:
+        payload["format"] = response_format
+    return payload
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in _RETRY_STATUS
+    return isinstance(exc, (httpx.TransportError, ValueError))  # ValueError: truncated/invalid JSON body
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _record(data: Dict[str, Any], latency: float, first_token: float = None):
+    with _stats_lock:
+        if first_token is not None:
+            _first_token.append(first_token)
+        _stats["calls"] += 1
+        _stats["prompt_tokens"] += data.get("prompt_eval_count", 0)
+        _stats["completion_tokens"] += data.get("eval_count", 0)
+        _stats["generation_seconds"] += data.get("eval_duration", 0) / 1e9
+        _latencies.append(latency)
+    logger.info("Ollama %s: %.2fs, %d prompt + %d completion tokens", data.get("model", OLLAMA_MODEL),
+                latency, data.get("prompt_eval_count", 0), data.get("eval_count", 0))
+
+
+def _text(data: Any) -> str:
+    if isinstance(data, dict):
+        return data.get("response", "")
+    return str(data)
+
+
+def generate(prompt: str, model: str = None, options: Dict[str, Any] = None,
+             retries: int = None, read_timeout: float = None,
+             response_format: Union[str, Dict[str, Any]] = None) -> str:
+    """Blocking generation through the pooled client; run it on an I/O worker thread."""
+    retries = RETRIES if retries is None else retries
+    payload = _payload(prompt, model, options, response_format)
+    for attempt in range(retries + 1):
+        _count("waiting")
+        with _slots:
+            _count("waiting", -1)
+            _count("in_flight")
+            start = time.perf_counter()
+            try:
+                response = client().post(GENERATE_PATH, json=payload, timeout=_timeout(read_timeout))
+                response.raise_for_status()
+                data = response.json()
+                _record(data, time.perf_counter() - start)
+                return _text(data)
+            except Exception as e:
+                error = e
+            finally:
+                _count("in_flight", -1)
+        if not _retryable(error) or attempt == retries:
+            break
+        delay = _backoff(attempt)
+        logger.warning("Ollama call failed (attempt %d), retrying in %.1fs: %s", attempt + 1, delay, error)
+        _count("retries")
+        time.sleep(delay)
+    _count("failed")
+    raise LLMError(f"Ollama call failed after {attempt + 1} attempt(s): {error}") from error
+
+
+async def _acquire():
+    """Take a slot without blocking the event loop: contended waits block a slot-waiter thread instead."""
+    _count("waiting")
+    try:
+        if not _slots.acquire(blocking=False):
+            waiter = asyncio.get_running_loop().run_in_executor(_slot_waiters, _slots.acquire)
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # the thread still gets the slot eventually; hand it straight back
+                waiter.add_done_callback(lambda _: _slots.release())
+                raise
+    finally:
+        _count("waiting", -1)
+    _count("in_flight")
+
+
+async def agenerate(prompt: str, model: str = None, options: Dict[str, Any] = None,
+                    retries: int = None, read_timeout: float = None,
+                    response_format: Union[str, Dict[str, Any]] = None) -> str:
+    """Async counterpart of `generate` for callers already on the event loop."""
+    retries = RETRIES if retries is None else retries
+    payload = _payload(prompt, model, options, response_format)
+    for attempt in range(retries + 1):
+        await _acquire()
+        start = time.perf_counter()
+        try:
+            response = await async_client().post(GENERATE_PATH, json=payload, timeout=_timeout(read_timeout))
+            response.raise_for_status()
+            data = response.json()
+            _record(data, time.perf_counter() - start)
+            return _text(data)
+        except Exception as e:
+            error = e
+        finally:
+            _count("in_flight", -1)
+            _slots.release()
+        if not _retryable(error) or attempt == retries:
+            break
+        delay = _backoff(attempt)
+        logger.warning("Ollama call failed (attempt %d), retrying in %.1fs: %s", attempt + 1, delay, error)
+        _count("retries")
+        await asyncio.sleep(delay)
+    _count("failed")
+    raise LLMError(f"Ollama call failed after {attempt + 1} attempt(s): {error}") from error
+
+
+async def astream(prompt: str, model: str = None, options: Dict[str, Any] = None,
+                  retries: int = None, read_timeout: float = None,
+                  response_format: Union[str, Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Yield pieces of the response as Ollama generates them (its NDJSON stream).
+    Failures are retried only until the first piece has been yielded; after that they raise.
+    With streaming, `read_timeout` bounds the gap between pieces rather than the whole generation.
+    """
+    retries = RETRIES if retries is None else retries
+    payload = _payload(prompt, model, options, response_format, stream=True)
+    for attempt in range(retries + 1):
+        first_token = None
+        await _acquire()
+        start = time.perf_counter()
+        try:
+            async with async_client().stream("POST", GENERATE_PATH, json=payload,
+                                             timeout=_timeout(read_timeout)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise LLMError(data["error"])
+                    piece = data.get("response", "")
+                    if piece:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        yield piece
+                    if data.get("done"):
+                        _record(data, time.perf_counter() - start, first_token)
+            return
+        except Exception as e:
+            error = e
+        finally:
+            _count("in_flight", -1)
+            _slots.release()
+        if first_token is not None or not _retryable(error) or attempt == retries:
+            break
+        delay = _backoff(attempt)
+        logger.warning("Ollama stream failed (attempt %d), retrying in %.1fs: %s", attempt + 1, delay, error)
+        _count("retries")
+        await asyncio.sleep(delay)
+    _count("failed")
+    raise LLMError(f"Ollama stream failed after {attempt + 1} attempt(s): {error}") from error
+
+
+def _percentile(values, q: float) -> float:
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3)
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        latencies = sorted(_latencies)
+        first_token = sorted(_first_token)
+        out = dict(_stats)
+    out["generation_seconds"] = round(out["generation_seconds"], 2)
+    out["max_concurrency"] = MAX_CONCURRENCY
+    if latencies:
+        out["latency_s_p50"] = _percentile(latencies, 0.5)
+        out["latency_s_p95"] = _percentile(latencies, 0.95)
+    if first_token:
+        out["first_token_s_p50"] = _percentile(first_token, 0.5)
+        out["first_token_s_p95"] = _percentile(first_token, 0.95)
+    if out["generation_seconds"]:
+        out["tokens_per_second"] = round(out["completion_tokens"] / out["generation_seconds"], 1)
+    return out
+
+
+async def aclose():
+    """Close both pooled clients (app shutdown)."""
+    global _client, _async_client
+    with _client_lock:
+        sync_client, a_client = _client, _async_client
+        _client = _async_client = None
+    if sync_client is not None:
+        sync_client.close()
+    if a_client is not None:
+        await a_client.aclose()
@@ -0,0 +1,260 @@
+import os
+import json
+import mmap
+import struct
+import threading
+from array import array
+from typing import List, Dict, Any, Optional, Iterable
+from app.utils.logger import get_logger
+
+logger = get_logger("metadata_store")
+
+# one fixed-width entry per row: (offset, length) of the row's record in the blob file
+_ENTRY = struct.Struct("<QI")
+
+
+class MetadataStore:
+    """
+    Append-only row store for the vector index metadata.
+    Records are compact JSON appended to `<name>.blob`; `<name>.idx` holds a fixed-width
+    (offset, length) entry per row id. Both files are memory-mapped, so opening the store
+    is O(1) and a lookup only decodes the rows that are actually asked for.
+    """
+
+    def __init__(self, directory: str, name: str = "meta"):
+        os.makedirs(directory, exist_ok=True)
+        self.blob_path = os.path.join(directory, f"{name}.blob")
+        self.idx_path = os.path.join(directory, f"{name}.idx")
+        self._lock = threading.RLock()
+        self._blob = self._open(self.blob_path)
+        self._idx = self._open(self.idx_path)
+        self._blob_map = None
+        self._idx_map = None
+        self._count = 0
+        self._recover()
+
+    @staticmethod
+    def _open(path: str):
+        # r+b rather than a+b: offsets are rewritten in place, which append mode forbids
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        return open(path, "r+b")
+
+    def _recover(self):
+        """Drop entries whose record never made it to disk (crash between the two writes)."""
+        blob_size = os.path.getsize(self.blob_path)
+        count = os.path.getsize(self.idx_path) // _ENTRY.size
+        while count > 0:
+            offset, length = self._read_entry(count - 1)
+            if offset + length <= blob_size:
+                break
+            count -= 1
+        if count * _ENTRY.size != os.path.getsize(self.idx_path):
+            logger.warning("Truncating %s to %d complete rows", self.idx_path, count)
+            self._idx.truncate(count * _ENTRY.size)
+        self._count = count
+
+    def _read_entry(self, row: int):
+        self._idx.seek(row * _ENTRY.size)
+        return _ENTRY.unpack(self._idx.read(_ENTRY.size))
+
+    def _remap(self):
+        self._remap_close()
+        if os.path.getsize(self.blob_path):
+            self._blob_map = mmap.mmap(self._blob.fileno(), 0, access=mmap.ACCESS_READ)
+        if os.path.getsize(self.idx_path):
+            self._idx_map = mmap.mmap(self._idx.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _mapped(self, row: int) -> bool:
+        return self._idx_map is not None and (row + 1) * _ENTRY.size <= len(self._idx_map)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, records: List[Optional[Dict[str, Any]]], fsync: bool = True) -> int:
+        """
+        Append records as new rows. Returns the row id of the first record.
+        The blob is written before the offsets so a torn write never exposes a bad row.
+        """
+        with self._lock:
+            self._blob.seek(0, os.SEEK_END)
+            offset = self._blob.tell()
+            payload = bytearray()
+            entries = bytearray()
+            for record in records:
+                data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                entries += _ENTRY.pack(offset + len(payload), len(data))
+                payload += data
+            self._blob.write(payload)
+            self._sync(self._blob, fsync)
+            self._idx.seek(self._count * _ENTRY.size)
+            self._idx.write(entries)
+            self._sync(self._idx, fsync)
+            first = self._count
+            self._count += len(records)
+            return first
+
+    def update(self, row: int, record: Optional[Dict[str, Any]], fsync: bool = True):
+        """
+        Replace the record of an existing row: the new record is appended to the blob
+        and the row's fixed-width entry is rewritten in place to point at it.
+        """
+        with self._lock:
+            if row < 0 or row >= self._count:
+                raise IndexError(f"row {row} out of range")
+            data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._blob.seek(0, os.SEEK_END)
+            offset = self._blob.tell()
+            self._blob.write(data)
+            self._sync(self._blob, fsync)
+            self._idx.seek(row * _ENTRY.size)
+            self._idx.write(_ENTRY.pack(offset, len(data)))
+            self._sync(self._idx, fsync)
+
+    @staticmethod
+    def _sync(f, fsync: bool):
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+    def get(self, row: int) -> Optional[Dict[str, Any]]:
+        """O(1) lookup of a single row; returns None for unknown rows."""
+        if row < 0 or row >= self._count:
+            return None
+        with self._lock:
+            if not self._mapped(row) or self._blob_map is None:
+                self._remap()
+            offset, length = _ENTRY.unpack_from(self._idx_map, row * _ENTRY.size)
+            if offset + length > len(self._blob_map):
+                self._remap()
+            return json.loads(self._blob_map[offset:offset + length])
+
+    def get_many(self, rows: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        return [self.get(int(row)) for row in rows]
+
+    def truncate(self, count: int):
+        """Forget every row >= count (used when the vector log is shorter after a crash)."""
+        with self._lock:
+            if count >= self._count:
+                return
+            self._remap_close()
+            self._idx.truncate(count * _ENTRY.size)
+            self._count = count
+
+    def _remap_close(self):
+        for m in (self._blob_map, self._idx_map):
+            if m is not None:
+                m.close()
+        self._blob_map = self._idx_map = None
+
+    def close(self):
+        with self._lock:
+            self._remap_close()
+            self._blob.close()
+            self._idx.close()
+
+
+class ContentHashIndex:
+    """
+    Row-aligned file of fixed-width content digests (entry i belongs to row i),
+    loaded into a digest -> row dict so duplicate chunks are found before embedding.
+    """
+
+    DIGEST_SIZE = 16
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._count = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            self._count = len(data) // self.DIGEST_SIZE
+            if len(data) % self.DIGEST_SIZE:
+                with open(path, "r+b") as f:
+                    f.truncate(self._count * self.DIGEST_SIZE)
+            for row in range(self._count):
+                digest = data[row * self.DIGEST_SIZE:(row + 1) * self.DIGEST_SIZE]
+                if any(digest):
+                    self._rows[digest] = row
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, digest: bytes) -> Optional[int]:
+        return self._rows.get(digest)
+
+    def append(self, digests: List[Optional[bytes]], fsync: bool = True):
+        """Append digests for the next rows; None (no digest) is stored as zeros."""
+        with self._lock:
+            payload = b"".join(d or bytes(self.DIGEST_SIZE) for d in digests)
+            with open(self.path, "ab") as f:
+                f.write(payload)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+            for i, digest in enumerate(digests):
+                if digest:
+                    self._rows[digest] = self._count + i
+            self._count += len(digests)
+
+    def clear(self, rows: Iterable[int], fsync: bool = True):
+        """Zero the digests of deleted rows so their text can be ingested again."""
+        with self._lock, open(self.path, "r+b") as f:
+            for row in rows:
+                if row >= self._count:
+                    continue
+                f.seek(row * self.DIGEST_SIZE)
+                digest = f.read(self.DIGEST_SIZE)
+                if self._rows.get(digest) == row:
+                    del self._rows[digest]
+                f.seek(row * self.DIGEST_SIZE)
+                f.write(bytes(self.DIGEST_SIZE))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+    def truncate(self, count: int):
+        with self._lock:
+            if count >= self._count:
+                return
+            with open(self.path, "r+b") as f:
+                f.truncate(count * self.DIGEST_SIZE)
+            self._rows = {d: r for d, r in self._rows.items() if r < count}
+            self._count = count
+
+
+class RowSet:
+    """Persistent, append-only set of row ids (e.g. tombstones of deleted rows)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        rows = array("q")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            rows.frombytes(data[:len(data) - len(data) % rows.itemsize])
+        self._rows = set(rows)
+
+    def __contains__(self, row: int) -> bool:
+        return row in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(list(self._rows))
+
+    def add(self, rows: Iterable[int], fsync: bool = True):
+        new = [int(r) for r in rows if r not in self._rows]
+        if not new:
+            return
+        with self._lock, open(self.path, "ab") as f:
+            f.write(array("q", new).tobytes())
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+            self._rows.update(new)
+
@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from app.utils.logger import get_logger
+
+logger = get_logger("model_registry")
+
+# comma separated model names this node never loads (e.g. "whisper" on a summarize-only pod)
+DISABLED_MODELS = {m.strip() for m in os.getenv("DISABLED_MODELS", "").split(",") if m.strip()}
+# models loaded in the background right after startup: "all", "none" or a comma separated list
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "all")
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised when a model is disabled on this node or failed to load."""
+
+
+_loaders: Dict[str, Callable[[], Any]] = {}
+_models: Dict[str, Any] = {}
+_status: Dict[str, Dict[str, Any]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_warmers: Dict[str, Optional[Callable[[], None]]] = {}
+
+
+def register(name: str, loader: Callable[[], Any], warmer: Callable[[], None] = None):
+    """
+    Register a model loader; nothing is loaded until `get` or `warm_up`.
+    `warmer` replaces the in-process load during warm-up for models used elsewhere (e.g. loaded
+    by worker processes); it raises ModelUnavailableError if they could not load the model.
+    """
+    _loaders[name] = loader
+    _warmers[name] = warmer
+    _locks.setdefault(name, threading.Lock())
+    _status[name] = {"state": "disabled" if name in DISABLED_MODELS else "not_loaded"}
+
+
+def get(name: str) -> Any:
+    """Return the model, loading it on first use (concurrent callers wait for one load)."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name in DISABLED_MODELS:
+        raise ModelUnavailableError(f"Model '{name}' is disabled on this node")
+    if name not in _loaders:
+        raise KeyError(f"Unknown model '{name}'")
+    with _locks[name]:
+        if name in _models:
+            return _models[name]
+        _status[name] = {"state": "loading"}
+        logger.info("Loading model %s", name)
+        start = time.perf_counter()
+        try:
+            model = _loaders[name]()
+        except Exception as e:
+            _status[name] = {"state": "failed", "error": str(e)}
+            logger.warning("Failed to load model %s: %s", name, e)
+            raise ModelUnavailableError(f"Model '{name}' failed to load: {e}") from e
+        _models[name] = model
+        _status[name] = {"state": "ready", "load_seconds": round(time.perf_counter() - start, 2)}
+        logger.info("Model %s ready in %.1fs", name, time.perf_counter() - start)
+        return model
+
+
+def warmup_names() -> List[str]:
+    if WARMUP_MODELS == "none":
+        return []
+    names = list(_loaders) if WARMUP_MODELS == "all" else [m.strip() for m in WARMUP_MODELS.split(",") if m.strip()]
+    return [n for n in names if n in _loaders and n not in DISABLED_MODELS]
+
+
+def _warm(name: str):
+    warmer = _warmers[name]
+    if warmer is None:
+        get(name)
+        return
+    _status[name] = {"state": "loading", "where": "workers"}
+    start = time.perf_counter()
+    try:
+        warmer()
+    except Exception as e:
+        _status[name] = {"state": "failed", "where": "workers", "error": str(e)}
+        logger.warning("Failed to warm up model %s in the workers: %s", name, e)
+        return
+    _status[name] = {"state": "ready", "where": "workers", "load_seconds": round(time.perf_counter() - start, 2)}
+    logger.info("Model %s ready in the workers in %.1fs", name, time.perf_counter() - start)
+
+
+def warm_up():
+    """Load the WARMUP_MODELS one after another in a background thread."""
+    def _run():
+        for name in warmup_names():
+            try:
+                _warm(name)
+            except ModelUnavailableError:
+                pass
+
+    threading.Thread(target=_run, name="model-warmup", daemon=True).start()
+
+
+def status() -> Dict[str, Any]:
+    """Per-model state plus overall readiness (every warm-up model loaded)."""
+    return {
+        "ready": all(_status[n]["state"] == "ready" for n in warmup_names()),
+        "models": {name: dict(state) for name, state in _status.items()},
+    }
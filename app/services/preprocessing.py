@@ -1,26 +1,235 @@
 import subprocess
 import fitz
-import whisper
 import os
+import asyncio
+import numpy as np
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from app.services import model_registry, asr
+from app.services.executor import PROCESS_WORKERS, run_io, run_process, set_process_initializer, warm_process_pool
 
+SAMPLE_RATE = 16000  # what Whisper expects
+# audio handed to Whisper at once: its native context is 30s, longer windows only cost memory
+WINDOW_SECONDS = float(os.getenv("TRANSCRIBE_WINDOW_SECONDS", "30"))
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "-40"))  # frames quieter than this (dBFS) are silence
+VAD_MIN_SILENCE = float(os.getenv("VAD_MIN_SILENCE", "0.3"))  # seconds of silence a window may be cut in
+# audio repeated at the start of each window, for cuts that found no pause; the repeat is removed when stitching
+OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "1.0"))
+# windows transcribed at once in the worker process pool (1 = one after another, with the previous text as prompt)
+TRANSCRIBE_PARALLEL = int(os.getenv("TRANSCRIBE_PARALLEL", str(max(1, PROCESS_WORKERS))))
+FRAME_SECONDS = 0.03
+_FRAME = int(SAMPLE_RATE * FRAME_SECONDS)
+_READ_SAMPLES = SAMPLE_RATE * 10  # decoded per read from ffmpeg
+_MIN_SPEECH_FRAMES = 3
+_PROMPT_CHARS = 200  # previous text passed to the next window for continuity
 
-whisper_model = whisper.load_model("base")
 
-def extract_audio(video_path:str, output_path:str = "temp_audio.wav") -> str:
-    """Extracts audio from video using ffmpeg."""
-    command = ["ffmpeg", "-i", video_path, "-vn", "-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1", output_path]
-    subprocess.run(command, check=True)
-    return output_path
+def _init_worker():
+    """Process pool initializer: load the ASR model before the worker takes its first window."""
+    try:
+        model_registry.get("whisper")
+    except model_registry.ModelUnavailableError:
+        pass  # reported by _worker_model_state; each transcription raises it again
+
+def _worker_model_state() -> Dict[str, Any]:
+    return model_registry.status()["models"]["whisper"]
+
+def _warm_workers():
+    """Start the worker processes, which load the ASR model as they start, and check that they did."""
+    for state in warm_process_pool(_worker_model_state):
+        if state["state"] != "ready":
+            raise model_registry.ModelUnavailableError(state.get("error") or f"whisper is {state['state']} in a worker")
+
+# The ASR backend (ASR_BACKEND, WHISPER_MODEL) is loaded on first use (or by the startup warm-up),
+# not at import time. With a process pool, transcription runs in the workers, which each load their own copy.
+if PROCESS_WORKERS > 0:
+    set_process_initializer(_init_worker)
+model_registry.register("whisper", asr.open_backend, warmer=_warm_workers if PROCESS_WORKERS > 0 else None)
+
+def audio_duration(path: str) -> Optional[float]:
+    """Duration of an audio or video file in seconds (ffprobe), None if it cannot be read."""
+    command = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path]
+    try:
+        return float(subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def _iter_pcm(audio_path: str) -> Iterator[np.ndarray]:
+    """Decode any file ffmpeg reads (audio or video) to 16 kHz mono float32, a few seconds at a time."""
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", audio_path, "-vn",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"]
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = proc.stdout.read(_READ_SAMPLES * 2)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {audio_path}: {proc.stderr.read().decode(errors='replace').strip()}")
+    finally:
+        if proc.poll() is None:  # consumer stopped early
+            proc.kill()
+            proc.wait()
+
+def _frame_db(samples: np.ndarray) -> np.ndarray:
+    """Loudness (dBFS) of each 30 ms frame."""
+    n = len(samples) // _FRAME
+    frames = samples[:n * _FRAME].reshape(n, _FRAME)
+    return 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10)
+
+def _cut_frame(db: np.ndarray) -> int:
+    """
+    Frame to end a full window at: inside the last pause of at least VAD_MIN_SILENCE in its
+    second half, else at the quietest frame there, so a word is rarely split between windows.
+    """
+    half = len(db) // 2
+    min_run = max(1, int(VAD_MIN_SILENCE / FRAME_SECONDS))
+    run_end = None
+    for i in range(len(db) - 1, half - 1, -1):
+        if db[i] < VAD_THRESHOLD_DB:
+            run_end = i if run_end is None else run_end
+            if run_end - i + 1 >= min_run:
+                return (i + run_end + 1) // 2
+        else:
+            run_end = None
+    return half + int(np.argmin(db[half:]))
+
+def _has_speech(db: np.ndarray) -> bool:
+    return int(np.count_nonzero(db >= VAD_THRESHOLD_DB)) >= _MIN_SPEECH_FRAMES
+
+def iter_audio_windows(audio_path: str, overlap: float = 0.0) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    (start seconds, samples) windows of at most TRANSCRIBE_WINDOW_SECONDS, decoded as a stream
+    (only about one window is held in memory) and cut inside pauses; windows without speech are skipped.
+    Each window but the first also repeats the last `overlap` seconds before it (see `Stitcher`),
+    so new audio is capped at the window length minus the overlap.
+    """
+    # overlap + cut must stay within Whisper's context, or it runs a second padded pass on the rest
+    window = int(max(WINDOW_SECONDS - overlap, WINDOW_SECONDS / 2) * SAMPLE_RATE)
+    buffer = np.empty(0, dtype=np.float32)
+    tail = buffer  # end of the previous window, repeated as overlap
+    offset = 0  # samples before the buffer
+    for block in _iter_pcm(audio_path):
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= window:
+            db = _frame_db(buffer[:window])
+            cut = max(1, _cut_frame(db)) * _FRAME
+            if _has_speech(db[:cut // _FRAME]):
+                yield (offset - len(tail)) / SAMPLE_RATE, np.concatenate([tail, buffer[:cut]])
+            tail = buffer[max(0, cut - int(overlap * SAMPLE_RATE)):cut] if overlap > 0 else tail
+            buffer, offset = buffer[cut:], offset + cut
+    if _has_speech(_frame_db(buffer)):
+        yield (offset - len(tail)) / SAMPLE_RATE, np.concatenate([tail, buffer])
+
+def transcribe_window(samples: np.ndarray, start: float, prompt: str = None,
+                      backend: asr.ASRBackend = None) -> List[Dict[str, Any]]:
+    """
+    Transcribe one window with `backend` (default: this process's ASR model);
+    segment timestamps are made absolute by adding `start` (seconds).
+    """
+    backend = backend or model_registry.get("whisper")
+    segments = backend.transcribe(samples, initial_prompt=prompt or None)
+    return [{"start": round(start + s["start"], 2), "end": round(start + s["end"], 2), "text": s["text"].strip()}
+            for s in segments if s["text"].strip()]
+
+def _next_prompt(segments: List[Dict[str, Any]], prompt: Optional[str]) -> Optional[str]:
+    return " ".join(s["text"] for s in segments)[-_PROMPT_CHARS:] or prompt
+
+def _words(text: str) -> List[str]:
+    return [w.strip(".,;:!?\"'").lower() for w in text.split()]
+
+
+class Stitcher:
+    """
+    Joins windows transcribed independently, in window order. Segments centred before the end
+    of the previous window (its overlap) are dropped; if the next one straddles that boundary,
+    its leading words that repeat the end of the previous text (heard by both windows) are too.
+    """
+
+    MAX_REPEAT_WORDS = 8
+
+    def __init__(self):
+        self.boundary: Optional[float] = None  # end of the previous window, seconds
+        self.previous = ""
+
+    def add(self, start: float, end: float, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.boundary is not None:
+            segments = [s for s in segments if (s["start"] + s["end"]) / 2 >= self.boundary]
+            if segments and segments[0]["start"] < self.boundary:  # straddles the boundary
+                text = self._strip_repeat(segments[0]["text"])
+                segments = ([{**segments[0], "text": text}] if text else []) + segments[1:]
+        self.boundary = end
+        if segments:
+            self.previous = segments[-1]["text"]
+        return segments
+
+    def _strip_repeat(self, text: str) -> str:
+        previous = _words(self.previous)[-self.MAX_REPEAT_WORDS:]
+        words = text.split()
+        for n in range(min(len(words), len(previous)), 0, -1):
+            if _words(" ".join(words[:n])) == previous[-n:]:
+                return " ".join(words[n:])
+        return text
+
+
+def transcribe_stream(audio_path: str) -> Iterator[Dict[str, Any]]:
+    """Timestamped segments ({start, end, text}) of an audio or video file, yielded window by window."""
+    prompt = None
+    stitcher = Stitcher()
+    for start, samples in iter_audio_windows(audio_path, OVERLAP_SECONDS):
+        segments = stitcher.add(start, start + len(samples) / SAMPLE_RATE, transcribe_window(samples, start, prompt))
+        yield from segments
+        prompt = _next_prompt(segments, prompt)
+
+async def astream_transcription(audio_path: str, parallel: int = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    `transcribe_stream` for the event loop: decoding and segmentation run on an I/O thread and up
+    to `parallel` (TRANSCRIBE_PARALLEL) windows are transcribed at once in the worker process pool,
+    each worker holding its own model. Segments are stitched and yielded in order as windows finish.
+    Only sequential transcription (parallel=1) passes the previous text to the next window as a prompt.
+    """
+    parallel = max(1, parallel or TRANSCRIBE_PARALLEL)
+    windows = iter_audio_windows(audio_path, OVERLAP_SECONDS)
+    pending = deque()  # (start, end, task) in window order
+    stitcher = Stitcher()
+    prompt = None
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < parallel:
+                window = await run_io(next, windows, None)
+                if window is None:
+                    exhausted = True
+                    break
+                start, samples = window
+                task = asyncio.ensure_future(run_process(transcribe_window, samples, start,
+                                                         prompt if parallel == 1 else None))
+                pending.append((start, start + len(samples) / SAMPLE_RATE, task))
+            if not pending:
+                break
+            start, end, task = pending.popleft()
+            segments = stitcher.add(start, end, await task)
+            for segment in segments:
+                yield segment
+            prompt = _next_prompt(segments, prompt)
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+        try:
+            windows.close()  # stops ffmpeg if the consumer went away
+        except ValueError:
+            pass  # cancelled while the I/O thread is inside it; ffmpeg is stopped when it is collected
+
+async def atranscribe(audio_path: str, parallel: int = None) -> str:
+    """Full transcript of an audio or video file, transcribed in parallel windows."""
+    return " ".join([segment["text"] async for segment in astream_transcription(audio_path, parallel)])
 
 def transcribe_audio(audio_path:str) -> str:
-    """Transcribes audio using Whisper model."""
-    result = whisper_model.transcribe(audio_path)
-    return result["text"]
+    """Transcribes audio using Whisper model, window by window (see `transcribe_stream`)."""
+    return " ".join(s["text"] for s in transcribe_stream(audio_path))
 
 def parse_pdf(pdf_path:str) -> str:
-    """Parses text from PDF using PyMuPDF."""
+    """Parses text from PDF using PyMuPDF. Pages are separated by a form feed character."""
     doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+    return "\f".join(page.get_text() for page in doc)
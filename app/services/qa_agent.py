@@ -1,5 +1,7 @@
+import os
 from typing import List, Dict, Any
-from app.services.embeddings import search
+from concurrent.futures import ThreadPoolExecutor
+from app.services.embeddings import search, search_many
 from app.utils.logger import get_logger
 from app.services.summarization import call_ollama
 import textwrap
@@ -8,19 +10,24 @@ logger = get_logger("qa_service")
 
 SIMILARITY_THRESHOLD = 0.55
 MAX_CONTEXT_CHUNKS = 5
+BATCH_CONCURRENCY = int(os.getenv("QA_BATCH_CONCURRENCY", "4"))  # parallel LLM calls per batch
+REDIRECT_MESSAGE = "I couldn't find relevant material in the provided course content. Please check the course materials or ask a more specific question about the covered topics."
 
-def is_on_topic(query: str, k: int = 5) -> tuple[bool, List[Dict[str, Any]]]:
+def is_on_topic(query: str, k: int = 5, nprobe: int = None, ef_search: int = None) -> tuple[bool, List[Dict[str, Any]]]:
     """
     Check if the query is on topic.
     Returns (is_on_topic, list of relevant documents)
     """
-    results = search(query, k)
+    results = search(query, k, nprobe=nprobe, ef_search=ef_search)
+    return _results_on_topic(results), results
+
+def _results_on_topic(results: List[tuple]) -> bool:
     if len(results) == 0:
-        return False, []
+        return False
     
     top_score = results[0][0]
     
-    return float(top_score) > SIMILARITY_THRESHOLD, results
+    return float(top_score) > SIMILARITY_THRESHOLD
 
 def build_context(results: List[tuple], max_chunks: int = MAX_CONTEXT_CHUNKS) -> str:
     """
@@ -64,26 +71,68 @@ def assemble_prompt(query: str, context: str, chat_history: List[Dict[str, str]]
         )
     return prompt
 
-def answer_query(query: str, chat_history: List[Dict[str,str]] = None, k:int = 5) -> Dict[str, Any]:
+def answer_query(query: str, chat_history: List[Dict[str,str]] = None, k:int = 5,
+                 nprobe: int = None, ef_search: int = None, use_cache: bool = True) -> Dict[str, Any]:
     """
     Top-level function: topic check -> retrieval -> LLM answer or polite redirect.
     Returns dict with keys: on_topic(bool), answer(str)/redirect(str), sources(list)
     """
-    on_topic, results = is_on_topic(query, k=k)
+    on_topic, results = is_on_topic(query, k=k, nprobe=nprobe, ef_search=ef_search)
+    return _answer_from_results(query, results, on_topic, chat_history, k, use_cache)
+
+def prepare_answer(query: str, chat_history: List[Dict[str,str]] = None, k: int = 5,
+                   nprobe: int = None, ef_search: int = None) -> tuple[Dict[str, Any], str]:
+    """
+    Retrieval half of `answer_query`, for streamed answers.
+    Returns (response without the answer, prompt); prompt is None when the query is off topic.
+    """
+    on_topic, results = is_on_topic(query, k=k, nprobe=nprobe, ef_search=ef_search)
+    return _response_from_results(results, on_topic, k), \
+        assemble_prompt(query, build_context(results), chat_history) if on_topic else None
+
+def answer_queries(queries: List[str], k: int = 5, nprobe: int = None, ef_search: int = None,
+                   use_cache: bool = True) -> List[Dict[str, Any]]:
+    """
+    Batched `answer_query` for independent questions (no chat history).
+    Retrieval runs as one batched search; LLM calls run concurrently.
+    A failed generation is reported in that query's `error` instead of failing the batch.
+    """
+    all_results = search_many(queries, k, nprobe=nprobe, ef_search=ef_search)
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        futures = [pool.submit(_answer_from_results, q, results, _results_on_topic(results), None, k, use_cache)
+                   for q, results in zip(queries, all_results)]
+    out = []
+    for query, future in zip(queries, futures):
+        try:
+            out.append(future.result())
+        except Exception as e:
+            logger.warning("Batch QA failed for %r: %s", query, e)
+            out.append({"on_topic": True, "answer": None, "sources": [], "error": str(e)})
+    return out
+
+def _answer_from_results(query: str, results: List[tuple], on_topic: bool,
+                         chat_history: List[Dict[str, str]] = None, k: int = 5, use_cache: bool = True) -> Dict[str, Any]:
+    res = _response_from_results(results, on_topic, k)
+    if not on_topic:
+        return res
+    context = build_context(results)
+    prompt = assemble_prompt(query, context, chat_history)
+    response = call_ollama(prompt, use_cache=use_cache)
+    res["answer"] = response.strip()
+    return res
+
+def _response_from_results(results: List[tuple], on_topic: bool, k: int = 5) -> Dict[str, Any]:
     if not on_topic:
         return {
             "on_topic": False,
             "answer": None,
-            "redirect": "I couldn't find relevant material in the provided course content. Please check the course materials or ask a more specific question about the covered topics.",
+            "redirect": REDIRECT_MESSAGE,
             "sources": []
         }
-    context = build_context(results)
-    prompt = assemble_prompt(query, context, chat_history)
-    response = call_ollama(prompt)
     top_sources = [md.get("doc_id") for (score, md) in results[:MAX_CONTEXT_CHUNKS]]
     return {
         "on_topic": True,
-        "answer": response.strip(),
+        "answer": None,
         "sources": top_sources,
-        "retrievals": [{"score": s, "doc_id": md["doc_id"], "source": md["source"]} for (s, md) in results[:k]]
-    }
\ No newline at end of file
+        "retrievals": [{"score": s, "doc_id": md["doc_id"], "chunk_id": md.get("chunk_id"), "source": md["source"]} for (s, md) in results[:k]]
+    }
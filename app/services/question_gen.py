@@ -1,41 +1,99 @@
 import os
-import json
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
-from fastapi.encoders import jsonable_encoder
 from app.utils.logger import get_logger
-from app.services.summarization import call_ollama
+from app.services import llm_client
+from app.services.summarization import call_ollama, parse_json_items
+from app.services.json_extract import require_array
+from app.services.question_store import QuestionStore, migrate_legacy_store
+from app.services.question_index import QuestionIndex, DEDUP_MODE
+from app.services.embeddings import get_source_chunks, mmr_select
 from app.models.request_models import Option
 
 logger = get_logger("question_service")
 
-STORE_FILE = "data/processed/questions_store.json"
-QUESTIONS: Dict[str, Dict[str, Any]] = {}
+# retrieval mode: indexed chunks of the source used as prompt contexts, chosen by MMR
+CONTEXT_CHUNKS = int(os.getenv("QUESTION_CONTEXT_CHUNKS", "4"))
+MMR_LAMBDA = float(os.getenv("QUESTION_MMR_LAMBDA", "0.7"))  # 1 = most central chunks only, 0 = most diverse
 
-def _persist_store(): # to store the question
-    try:
-        os.makedirs(os.path.dirname(STORE_FILE), exist_ok=True)
-        with open(STORE_FILE, "w", encoding="utf-8") as f:
-            json.dump(jsonable_encoder(QUESTIONS), f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.warning("Could not persist question store: %s", e)
-        
-def load_store():
-    try:
-        if os.path.exists(STORE_FILE):
-            with open(STORE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                QUESTIONS.update(data)
-    except Exception as e:
-        logger.warning("Could not load question store: %s", e)
-        
 
-load_store()
+class SourceNotIndexedError(ValueError):
+    """Raised when retrieval-grounded generation is asked for a source with no indexed chunks."""
+
+
+QUESTION_STORE = QuestionStore()
+migrate_legacy_store(QUESTION_STORE)
+QUESTION_INDEX = QuestionIndex()
+
+ITEM_SCHEMAS = {
+    "mcq": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "options": {"type": "array", "items": {"type": "string"}},
+            "answer_index": {"type": "integer"},
+            "rationale": {"type": "string"},
+        },
+        "required": ["question", "options", "answer_index", "rationale"],
+    },
+    "tf": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "answer": {"type": "boolean"},
+            "rationale": {"type": "string"},
+        },
+        "required": ["question", "answer", "rationale"],
+    },
+}
+
 
-def generate_questions_from_text(text: str, source: str = None, Q_type: str=None, n: int = 3, difficulty: int = 2) -> List[Dict[str, Any]]:
+def _usable(item: Any, Q_type: str) -> bool:
+    """Drop salvaged items that parse as JSON but cannot become a question."""
+    if not isinstance(item, dict) or not item.get("question"):
+        return False
+    if Q_type == "mcq":
+        options, index = item.get("options"), item.get("answer_index", 0)
+        return isinstance(options, list) and isinstance(index, int) and 0 <= index < len(options)
+    return isinstance(item.get("answer", False), bool)
+
+
+def generate_questions_from_text(text: str, source: str = None, Q_type: str=None, n: int = 3, difficulty: int = 2,
+                                 use_cache: bool = True) -> List[Dict[str, Any]]:
     """
     Use LLM to generate MCQs and TF questions. Return list of question dicts (not yet approved).
     """
+    return _store_new(_generate(text, source, Q_type, n, difficulty, use_cache))
+
+
+def generate_questions_from_source(source: str, Q_type: str = None, n: int = 3, difficulty: int = 2,
+                                   use_cache: bool = True) -> List[Dict[str, Any]]:
+    """
+    Generate questions grounded in the indexed chunks of `source` instead of its full text:
+    up to QUESTION_CONTEXT_CHUNKS chunks that are central to the source yet different from each
+    other are picked by MMR over their stored embeddings, and each is sent, alone, with its share
+    of the n questions. The per-chunk prompts run in parallel.
+    """
+    chunks, vectors = get_source_chunks(source)
+    if not chunks:
+        raise SourceNotIndexedError(f"No indexed chunks for source {source!r}: ingest it first or pass its text")
+    k = min(CONTEXT_CHUNKS, n, len(chunks))
+    if k < 1:
+        return []
+    picked = sorted(mmr_select(vectors, k, MMR_LAMBDA))  # document order keeps prompts stable for the cache
+    shares = [n // k + (i < n % k) for i in range(k)]
+    logger.info("Generating %d questions from %d of %d chunks of %s", n, k, len(chunks), source)
+
+    def from_chunk(row: int, share: int) -> List[Dict[str, Any]]:
+        return _generate(chunks[row]["text"], source, Q_type, share, difficulty, use_cache)[:share]
+
+    with ThreadPoolExecutor(max_workers=k) as pool:
+        batches = list(pool.map(from_chunk, picked, shares))
+    return _store_new([q for batch in batches for q in batch])
+
+
+def _generate(text: str, source: str, Q_type: str, n: int, difficulty: int, use_cache: bool) -> List[Dict[str, Any]]:
     # Build prompt: ask for JSON output to facilitate parsing
     MCQ_prompt = (
         "You are an educational question generator. From the provided text, create:\n"
@@ -72,10 +130,16 @@ def generate_questions_from_text(text: str, source: str = None, Q_type: str=None
     elif Q_type == "tf":
         prompt = TF_prompt
         
-    raw = call_ollama(prompt)
-    parsed = json.loads(raw)
+    schema = {"type": "object", "properties": {"Question": {"type": "array", "items": ITEM_SCHEMAS[Q_type]}},
+              "required": ["Question"]}
+    raw = call_ollama(prompt, use_cache=use_cache, validate=require_array,
+                      response_format=llm_client.json_format(schema))
+    items = parse_json_items(raw, ITEM_SCHEMAS[Q_type], key="Question", use_cache=use_cache)
     out = []
-    for item in parsed.get("Question", []):
+    for item in items:
+        if not _usable(item, Q_type):
+            logger.warning("Skipping malformed %s question item: %r", Q_type, item)
+            continue
         qid = str(uuid.uuid4())
         if Q_type == "mcq":
             options = [Option(id=i, option=opt) for i, opt in enumerate(item["options"])]
@@ -96,9 +160,31 @@ def generate_questions_from_text(text: str, source: str = None, Q_type: str=None
             "difficulty": difficulty,
             "rationale": item.get("rationale", ""),
         }
-        QUESTIONS[qid] = qdict
         out.append(qdict)
-    _persist_store()
+    return out
+
+
+def _store_new(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Store the questions that are not paraphrases of the bank (or of each other). With
+    QUESTION_DEDUP_MODE=merge a duplicate is returned as the stored question it matches.
+    """
+    dup_of = QUESTION_INDEX.admit(questions)
+    new = [q for q, dup in zip(questions, dup_of) if dup is None]
+    QUESTION_STORE.add(new)
+    if len(new) < len(questions):
+        logger.info("Dropped %d near-duplicate questions of %d generated", len(questions) - len(new), len(questions))
+    if DEDUP_MODE != "merge":
+        return new
+    out, seen = [], set()
+    for q, dup in zip(questions, dup_of):
+        qid = q["question_id"] if dup is None else dup
+        if qid in seen:
+            continue
+        seen.add(qid)
+        stored = q if dup is None else QUESTION_STORE.get(dup)
+        if stored is not None:
+            out.append(stored)
     return out
 
 # def self_reflect_and_score(question: Dict[str, Any]) -> Dict[str, Any]:
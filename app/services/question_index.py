@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+import numpy as np
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.db import connect
+from app.utils.logger import get_logger
+from app.services import ann_index
+from app.services.embeddings import embed_texts, EMBED_BATCH_SIZE
+from app.services.model_registry import ModelUnavailableError
+from app.services.question_store import QUESTION_STORE_FILE
+
+logger = get_logger("question_index")
+
+# cosine similarity of question texts above which a new question counts as a paraphrase
+DEDUP_THRESHOLD = float(os.getenv("QUESTION_DEDUP_THRESHOLD", "0.92"))
+# "merge": a duplicate is answered with the stored question, "reject": it is dropped, "off": no check
+DEDUP_MODE = os.getenv("QUESTION_DEDUP_MODE", "merge")
+# "source": compare with questions of the same source, "bank": with the whole bank (same type either way)
+DEDUP_SCOPE = os.getenv("QUESTION_DEDUP_SCOPE", "source")
+
+if DEDUP_MODE not in ("merge", "reject", "off"):
+    raise ValueError(f"QUESTION_DEDUP_MODE must be 'merge', 'reject' or 'off', got {DEDUP_MODE!r}")
+if DEDUP_SCOPE not in ("source", "bank"):
+    raise ValueError(f"QUESTION_DEDUP_SCOPE must be 'source' or 'bank', got {DEDUP_SCOPE!r}")
+
+
+class QuestionIndex:
+    """
+    Embeddings of the stored question texts, kept in the question bank's database and served from
+    one exact inner-product FAISS index per (source, type) group (per type with QUESTION_DEDUP_SCOPE=bank).
+    Checking a generated batch costs one encode call and one matrix search per group.
+    """
+
+    def __init__(self, path: str = QUESTION_STORE_FILE):
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS question_vectors (row INTEGER PRIMARY KEY, id TEXT UNIQUE, "
+                         "source TEXT, type TEXT, vector BLOB)")
+        self._db.commit()
+        self._groups: Optional[Dict[Tuple, Any]] = None  # group -> faiss index, loaded on first use
+        self._ids: Dict[int, str] = {}  # faiss id (row) -> question id
+        self._last_row = 0  # highest row read back from the database; other processes add rows too
+        self.stats: Dict[str, int] = {"checked": 0, "duplicates": 0}
+
+    @staticmethod
+    def _group(question: Dict[str, Any]) -> Tuple:
+        return (question.get("source") if DEDUP_SCOPE == "source" else None, question.get("type"))
+
+    def _add(self, rows: List[int], questions: List[Dict[str, Any]], vectors: np.ndarray):
+        """Index the given rows; rows already indexed are skipped."""
+        by_group = defaultdict(list)
+        for i, q in enumerate(questions):
+            if rows[i] in self._ids:
+                continue
+            by_group[self._group(q)].append(i)
+            self._ids[rows[i]] = q["question_id"]
+        for group, idxs in by_group.items():
+            index = self._groups.get(group)
+            if index is None:
+                index = self._groups[group] = ann_index.make_index("flat", vectors.shape[1])
+            index.add_with_ids(np.ascontiguousarray(vectors[idxs]), np.array([rows[i] for i in idxs], dtype="int64"))
+
+    def _persist(self, questions: List[Dict[str, Any]], vectors: np.ndarray) -> List[int]:
+        """Store the vectors; SQLite assigns the rows, so processes sharing the file never collide."""
+        rows = []
+        for q, vec in zip(questions, vectors):
+            cursor = self._db.execute("INSERT OR IGNORE INTO question_vectors (id, source, type, vector) "
+                                      "VALUES (?, ?, ?, ?)", (q["question_id"], q.get("source"), q.get("type"),
+                                                              vec.tobytes()))
+            if cursor.rowcount:
+                rows.append(cursor.lastrowid)
+            else:  # already stored (e.g. by another process)
+                rows.append(self._db.execute("SELECT row FROM question_vectors WHERE id = ?",
+                                             (q["question_id"],)).fetchone()[0])
+        self._db.commit()
+        return rows
+
+    def _catch_up(self):
+        """Index the rows stored since the last read, including those written by other processes."""
+        records = self._db.execute("SELECT row, id, source, type, vector FROM question_vectors WHERE row > ? "
+                                   "ORDER BY row", (self._last_row,)).fetchall()
+        if not records:
+            return
+        self._last_row = records[-1][0]
+        records = [r for r in records if r[0] not in self._ids]
+        if records:
+            self._add([r[0] for r in records],
+                      [{"question_id": r[1], "source": r[2], "type": r[3]} for r in records],
+                      np.stack([np.frombuffer(r[4], dtype="float32") for r in records]))
+
+    def _load(self):
+        """Build the group indexes from the stored vectors, embedding questions stored before this index existed."""
+        if self._groups is not None:
+            return
+        self._groups = {}
+        self._catch_up()
+        missing = self._db.execute("SELECT q.payload FROM questions q LEFT JOIN question_vectors v ON v.id = q.id "
+                                   "WHERE v.id IS NULL").fetchall()
+        if missing:
+            logger.info("Embedding %d stored questions for duplicate detection", len(missing))
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = [json.loads(r[0]) for r in missing[start:start + EMBED_BATCH_SIZE]]
+            vectors = np.asarray(embed_texts([q.get("question", "") for q in batch]), dtype="float32")
+            self._add(self._persist(batch, vectors), batch, vectors)
+
+    def admit(self, questions: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        For each generated question, the id of the stored question (or the earlier question of
+        the same batch) it paraphrases, or None if it is new. New questions are indexed right
+        away, under the same lock as the check, so concurrent batches cannot both keep a paraphrase.
+        """
+        if DEDUP_MODE == "off" or not questions:
+            return [None] * len(questions)
+        try:
+            vectors = np.asarray(embed_texts([q["question"] for q in questions]), dtype="float32")
+        except ModelUnavailableError as e:
+            logger.warning("Skipping duplicate check of generated questions: %s", e)
+            return [None] * len(questions)
+        dup_of: List[Optional[str]] = [None] * len(questions)
+        by_group = defaultdict(list)
+        for i, q in enumerate(questions):
+            by_group[self._group(q)].append(i)
+        with self._lock:
+            self._load()
+            self._catch_up()
+            for group, idxs in by_group.items():
+                group_vectors = vectors[idxs]
+                index = self._groups.get(group)
+                if index is not None and index.ntotal:
+                    scores, rows = index.search(group_vectors, 1)
+                    for i, score, row in zip(idxs, scores[:, 0], rows[:, 0]):
+                        if row >= 0 and score >= DEDUP_THRESHOLD:
+                            dup_of[i] = self._ids[int(row)]
+                # paraphrases within the batch: the first one is kept
+                sims = group_vectors @ group_vectors.T
+                for a, i in enumerate(idxs):
+                    if dup_of[i] is not None:
+                        continue
+                    for b in range(a):
+                        if dup_of[idxs[b]] is None and sims[a, b] >= DEDUP_THRESHOLD:
+                            dup_of[i] = questions[idxs[b]]["question_id"]
+                            break
+            new = [i for i, dup in enumerate(dup_of) if dup is None]
+            if new:
+                new_questions = [questions[i] for i in new]
+                self._add(self._persist(new_questions, vectors[new]), new_questions, vectors[new])
+            self.stats["checked"] += len(questions)
+            self.stats["duplicates"] += len(questions) - len(new)
+        return dup_of
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "mode": DEDUP_MODE, "scope": DEDUP_SCOPE, "threshold": DEDUP_THRESHOLD,
+                    "indexed": len(self._ids) if self._groups is not None else None}
@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from app.utils.db import connect
+from app.utils.logger import get_logger
+
+logger = get_logger("question_store")
+
+QUESTION_STORE_FILE = os.getenv("QUESTION_STORE_FILE", "data/processed/questions.sqlite")
+LEGACY_STORE_FILE = "data/processed/questions_store.json"  # whole-bank JSON written by older versions
+
+
+class QuestionStore:
+    """
+    Question bank in SQLite: one row per question, indexed for filtering by source, type and
+    difficulty. Writes are single transactions per batch, so generation cost does not grow with the bank.
+    """
+
+    def __init__(self, path: str = QUESTION_STORE_FILE):
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS questions (id TEXT PRIMARY KEY, source TEXT, type TEXT, "
+                         "difficulty INTEGER, payload TEXT, created REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS questions_source ON questions (source, created)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS questions_type ON questions (type, difficulty)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS questions_difficulty ON questions (difficulty)")
+        self._db.commit()
+
+    def add(self, questions: List[Dict[str, Any]]):
+        now = time.time()
+        rows = [(q["question_id"], q.get("source"), q.get("type"), q.get("difficulty"),
+                 json.dumps(jsonable_encoder(q), ensure_ascii=False), now) for q in questions]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def get(self, question_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM questions WHERE id = ?", (question_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, source: str = None, q_type: str = None, difficulty: int = None,
+              limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Questions matching every given filter, newest first; returns (page, total matches)."""
+        where, args = [], []
+        for column, value in (("source", source), ("type", q_type), ("difficulty", difficulty)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM questions{clause}", args).fetchone()[0]
+            rows = self._db.execute(f"SELECT payload FROM questions{clause} ORDER BY created DESC, id LIMIT ? OFFSET ?",
+                                    (*args, limit, offset)).fetchall()
+        return [json.loads(r[0]) for r in rows], total
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+
+def migrate_legacy_store(store: QuestionStore, path: str = LEGACY_STORE_FILE):
+    """Import the old questions_store.json once, then rename it so it is not imported again."""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        store.add([{**q, "question_id": q.get("question_id", qid)} for qid, q in data.items()])
+        os.replace(path, path + ".migrated")
+        logger.info("Migrated %d questions from %s", len(data), path)
+    except Exception as e:
+        logger.warning("Could not migrate question store %s: %s", path, e)
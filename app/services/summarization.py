@@ -1,49 +1,155 @@
 import os
-import requests
-from typing import List, Dict
+import math
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Dict, Optional
 from app.utils.logger import get_logger
-from time import sleep
+from app.services import llm_client
+from app.services.llm_client import OLLAMA_MODEL
+from app.services.llm_cache import LLMResponseCache, response_key
+from app.services.json_extract import Fragment, salvage_items, require_array
+from app.services.chunking import PAGE_BREAK, approx_tokens, iter_chunks
 import json
 
 logger = get_logger(name="summarization_service")
 
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# text per map-step prompt; leaves room for the instructions and the answer in Ollama's context window
+SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "1500"))
+MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+SECTION_CACHE_SIZE = int(os.getenv("SUMMARY_SECTION_CACHE_SIZE", "1024"))
+REPAIR_MAX_FRAGMENTS = int(os.getenv("LLM_REPAIR_MAX_FRAGMENTS", "3"))  # repair calls per response at most
 
-OLLAMA_API_PATH = f"{OLLAMA_URL}/api/generate"
+LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE", "data/processed/llm_cache.sqlite")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))  # 0 disables the response cache
 
+_section_cache: "OrderedDict[str, Any]" = OrderedDict()
+_section_cache_lock = threading.Lock()
+_response_cache = LLMResponseCache(LLM_CACHE_FILE, int(LLM_CACHE_MAX_MB * 1024 * 1024)) if LLM_CACHE_MAX_MB > 0 else None
+_json_stats: Dict[str, int] = {"responses": 0, "salvaged": 0, "repair_calls": 0, "repaired_items": 0,
+                               "repair_failed": 0, "dropped_fragments": 0}
+_json_stats_lock = threading.Lock()
 
-def call_ollama(prompt:str, retries:int = 2) -> str:
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
-    }
-    
-    attempt = 0
-    while attempt<=retries:
+POINTS_SCHEMA = {"type": "array", "items": {"type": "string"}}
+TOC_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {"title": {"type": "string"}, "hint": {"type": "string"}},
+    "required": ["title", "hint"],
+}
+
+
+def _cache_lookup(key: str, use_cache: bool) -> Optional[str]:
+    if _response_cache is None:
+        return None
+    if not use_cache:
+        _response_cache.record_bypass()
+        return None
+    return _response_cache.get(key)
+
+
+def call_ollama(prompt:str, retries:int = None, use_cache:bool = True,
+                validate:Callable[[str], Any] = None, response_format:Any = None) -> str:
+    """
+    Blocking generation through the shared pooled client (timeouts, backoff, concurrency cap).
+    Responses are cached by (model, prompt, options); use_cache=False forces a fresh generation
+    (which then replaces the cached one). With `validate`, a response is only cached if it
+    passes (raises no ValueError), so a malformed answer is not served again.
+    `response_format` constrains the output (see llm_client.json_format).
+    """
+    key = response_key(OLLAMA_MODEL, prompt, {"format": response_format} if response_format else None)
+    cached = _cache_lookup(key, use_cache)
+    if cached is not None:
+        return cached
+    raw = llm_client.generate(prompt, retries=retries, response_format=response_format)
+    if _response_cache is not None:
         try:
-            logger.info("Calling Ollama model %s (attempt %d)", OLLAMA_MODEL, attempt + 1)
-            response = requests.post(OLLAMA_API_PATH, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            
-            if isinstance(data, Dict):
-                text = data.get("response", "")
-            
-                return text
-            
-            return str(data)
-        
-        except Exception as e:
-            logger.warning("Ollama call failed (attempt %d): %s", attempt + 1, e)
-            attempt += 1
-            sleep(1)
-    
-    raise RuntimeError("Failed to call Ollama after retries")
+            if validate is not None:
+                validate(raw)
+            _response_cache.put(key, raw)
+        except ValueError:
+            logger.warning("Not caching malformed LLM output (%d chars)", len(raw))
+    return raw
+
+
+def _count_json(key: str, n: int = 1):
+    with _json_stats_lock:
+        _json_stats[key] += n
+
+
+def _repair_fragment(fragment: str, item_schema: Dict[str, Any], use_cache: bool) -> List[Any]:
+    """Ask the model to re-emit only the broken part of an answer as valid items."""
+    prompt = (
+        "The following fragment of a JSON array written by a model is malformed or cut off.\n"
+        f"Rewrite it as a JSON array whose items match this JSON schema: {json.dumps(item_schema)}\n"
+        "Keep the original content; leave out an item only if it cannot be recovered. Return only the JSON array.\n\n"
+        f"Fragment:\n{fragment}"
+    )
+    _count_json("repair_calls")
+    try:
+        raw = call_ollama(prompt, use_cache=use_cache, validate=require_array,
+                          response_format=llm_client.json_format({"type": "array", "items": item_schema}))
+    except Exception as e:
+        logger.warning("JSON repair call failed: %s", e)
+        _count_json("repair_failed")
+        return []
+    items = [item for item in salvage_items(raw) if not isinstance(item, Fragment)]
+    _count_json("repaired_items" if items else "repair_failed", len(items) or 1)
+    return items
 
 
-def extractive_summary(text:str, n_sentences:int=8) -> List[str]:
+def parse_json_items(raw: str, item_schema: Dict[str, Any], key: str = None, use_cache: bool = True) -> List[Any]:
+    """
+    Items of the JSON array in model output `raw` (top-level or under `key`), keeping every element
+    that parses. Each broken or truncated element gets one small repair call (up to
+    REPAIR_MAX_FRAGMENTS) instead of regenerating the whole answer. Raises ValueError if nothing is usable.
+    """
+    out = []
+    fragments = 0
+    for item in salvage_items(raw, key):
+        if not isinstance(item, Fragment):
+            out.append(item)
+            continue
+        fragments += 1
+        if fragments <= REPAIR_MAX_FRAGMENTS:
+            out.extend(_repair_fragment(item, item_schema, use_cache))
+        else:
+            _count_json("dropped_fragments")
+    _count_json("responses")
+    if fragments:
+        _count_json("salvaged")
+        logger.info("Salvaged model output: %d items kept, %d broken fragments", len(out), fragments)
+    if not out:
+        raise ValueError(f"Model output contained no usable JSON items: {raw[:200]!r}")
+    return out
+
+
+def get_json_parse_stats() -> Dict[str, int]:
+    with _json_stats_lock:
+        return dict(_json_stats)
+
+
+async def stream_ollama(prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+    """Streamed `call_ollama`: a cached response is yielded as a single piece."""
+    key = response_key(OLLAMA_MODEL, prompt)
+    cached = await asyncio.to_thread(_cache_lookup, key, use_cache)
+    if cached is not None:
+        yield cached
+        return
+    pieces = []
+    async for piece in llm_client.astream(prompt):
+        pieces.append(piece)
+        yield piece
+    if _response_cache is not None:
+        await asyncio.to_thread(_response_cache.put, key, "".join(pieces))
+
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    return _response_cache.info() if _response_cache is not None else {"enabled": False}
+
+
+def extractive_summary(text:str, n_sentences:int=8, use_cache:bool=True) -> List[str]:
     """
     Use the model to extract N key sentences or bullet points.
     """
@@ -54,12 +160,13 @@ def extractive_summary(text:str, n_sentences:int=8) -> List[str]:
         "example: [\"Sentence 1\", \"Sentence 2\", ...]"
     )
     
-    raw = call_ollama(prompt)
-    response = json.loads(raw)
-    return [str(s).strip() for s in response][:n_sentences]
+    raw = call_ollama(prompt, use_cache=use_cache, validate=require_array,
+                      response_format=llm_client.json_format(POINTS_SCHEMA))
+    response = parse_json_items(raw, POINTS_SCHEMA["items"], use_cache=use_cache)
+    return [str(s).strip() for s in response if str(s).strip()][:n_sentences]
 
 
-def generate_TOC(text:str, max_level:int=3) -> List[Dict[str,str]]:
+def generate_TOC(text:str, max_level:int=3, use_cache:bool=True) -> List[Dict[str,str]]:
     """
     Use the model to generate a Table of Contents (TOC) for the given text.
     """
@@ -70,24 +177,26 @@ def generate_TOC(text:str, max_level:int=3) -> List[Dict[str,str]]:
     "The Output must be like this example: [{\"title\": \"Title 1\", \"hint\": \"Summary of title 1\"}]"
     "The Output must be a valid JSON array. No extra commentary."
 )
-    raw = call_ollama(prompt)
+    raw = call_ollama(prompt, use_cache=use_cache, validate=require_array,
+                      response_format=llm_client.json_format({"type": "array", "items": TOC_ITEM_SCHEMA}))
 
-    res = json.loads(raw)
+    res = parse_json_items(raw, TOC_ITEM_SCHEMA, use_cache=use_cache)
     out = []
     for item in res:
+        if not isinstance(item, dict) or not item.get("title"):
+            continue
         title = item.get("title")
         hint = item.get("hint", "")
         out.append({"title": str(title), "hint": str(hint)})
     return out
 
-def abstractive_summary(key_points: List[str], Toc:List[Dict], style: str = "concise", comments:str=None) -> str:
+def abstractive_prompt(key_points: List[str], Toc:List[Dict], style: str = "concise", comments:str=None) -> str:
     """
-    Use the model to generate a summary for the given text.
+    Build the prompt for the abstractive step (shared by the blocking and streamed paths).
     """
     kp_text = "\n".join(f"- {s}" for s in key_points)
     toc_text = "\n".join(f"- {s['title']}: {s['hint']}, " for s in Toc)
-    print("i alomst finish")
-    prompt = (
+    return (
         f"Using the following key points and table of contents, write a {style} narrative summary suitable for a student study guide. "
         "Include brief examples where helpful, and keep it well-structured with paragraphs using the following table of contents and following the EDITOR NOTE.\n\n"
         f"Key points:\n{kp_text}\n\n"
@@ -95,6 +204,116 @@ def abstractive_summary(key_points: List[str], Toc:List[Dict], style: str = "con
         f"Table of Contents:\n{toc_text}\n\n"
         "Provide the final summary only."
     )
-    raw = call_ollama(prompt)
 
-    return raw.strip()
\ No newline at end of file
+def abstractive_summary(key_points: List[str], Toc:List[Dict], style: str = "concise", comments:str=None,
+                        use_cache:bool=True) -> str:
+    """
+    Use the model to generate a summary for the given text.
+    """
+    raw = call_ollama(abstractive_prompt(key_points, Toc, style, comments), use_cache=use_cache)
+
+    return raw.strip()
+
+
+def needs_map_reduce(text: str) -> bool:
+    """True when `text` does not fit one prompt and must be summarized section by section."""
+    return approx_tokens(text) > SECTION_TOKENS
+
+
+def split_sections(text: str, max_tokens: int = SECTION_TOKENS) -> List[str]:
+    """Cut text into prompt-sized sections on sentence boundaries (pages are packed together)."""
+    text = text.replace(PAGE_BREAK, "\n\n")
+    return [c["text"] for c in iter_chunks(text, max_tokens=max_tokens, overlap=0)]
+
+
+def _cached_section(kind: str, fn: Callable, section: str, *args, use_cache: bool = True) -> Any:
+    """
+    Run one map step, remembering its result per (model, step, args, section text), so
+    re-summarizing the same material (e.g. with new comments) skips the map calls.
+    """
+    key = hashlib.sha1(f"{OLLAMA_MODEL}\0{kind}\0{args}\0{section}".encode("utf-8")).hexdigest()
+    with _section_cache_lock:
+        if use_cache and key in _section_cache:
+            _section_cache.move_to_end(key)
+            return _section_cache[key]
+    result = fn(section, *args, use_cache=use_cache)
+    with _section_cache_lock:
+        _section_cache[key] = result
+        while len(_section_cache) > SECTION_CACHE_SIZE:
+            _section_cache.popitem(last=False)
+    return result
+
+
+def _map(kind: str, fn: Callable, sections: List[str], *args, use_cache: bool = True) -> List[Any]:
+    if not sections:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAP_CONCURRENCY, len(sections))) as pool:
+        return list(pool.map(lambda section: _cached_section(kind, fn, section, *args, use_cache=use_cache), sections))
+
+
+def _bullets(items: List[str]) -> str:
+    return "\n".join(f"- {item}" for item in items)
+
+
+def _group(items: List[str], max_tokens: int = SECTION_TOKENS) -> List[List[str]]:
+    groups, current, tokens = [], [], 0
+    for item in items:
+        n = approx_tokens(item)
+        if current and tokens + n > max_tokens:
+            groups.append(current)
+            current, tokens = [], 0
+        current.append(item)
+        tokens += n
+    if current:
+        groups.append(current)
+    return groups
+
+
+def map_reduce_extractive(text: str, n_sentences: int = 8, use_cache: bool = True) -> List[str]:
+    """
+    Extractive summary of a text too long for one prompt: extract key points per section
+    in parallel, then select the final `n_sentences` from them, in rounds if they still do not fit.
+    """
+    sections = split_sections(text)
+    if not sections:  # nothing but whitespace
+        return []
+    per_section = max(2, math.ceil(n_sentences / len(sections)) + 1)  # over-extract so the reduce can choose
+    points = [p for part in _map("extractive", extractive_summary, sections, per_section, use_cache=use_cache)
+              for p in part]
+    logger.info("Map-reduce extractive: %d sections -> %d candidate points", len(sections), len(points))
+    while len(points) > n_sentences:
+        groups = _group(points)
+        if len(groups) == 1:
+            return _cached_section("extractive", extractive_summary, _bullets(points), n_sentences, use_cache=use_cache)
+        per_group = max(2, math.ceil(n_sentences / len(groups)) + 1)
+        reduced = [p for part in _map("extractive", extractive_summary, [_bullets(g) for g in groups], per_group,
+                                      use_cache=use_cache) for p in part]
+        if len(reduced) >= len(points):  # the model is not condensing; stop rather than loop
+            break
+        points = reduced
+    return points[:n_sentences]
+
+
+def map_reduce_TOC(text: str, max_level: int = 3, use_cache: bool = True) -> List[Dict[str, str]]:
+    """
+    TOC of a text too long for one prompt: outline each section in parallel,
+    then merge the section outlines (in rounds if needed) into one TOC.
+    """
+    sections = split_sections(text)
+    if not sections:
+        return []
+    entries = [f"{item['title']}: {item['hint']}"
+               for part in _map("toc", generate_TOC, sections, max_level, use_cache=use_cache) for item in part]
+    logger.info("Map-reduce TOC: %d sections -> %d outline entries", len(sections), len(entries))
+    while True:
+        if not entries:  # no section yielded a titled entry
+            return []
+        groups = _group(entries)
+        if len(groups) == 1:
+            return _cached_section("toc", generate_TOC, _bullets(entries), max_level, use_cache=use_cache)
+        merged = [f"{item['title']}: {item['hint']}"
+                  for part in _map("toc", generate_TOC, [_bullets(g) for g in groups], max_level, use_cache=use_cache)
+                  for item in part]
+        if len(merged) >= len(entries):
+            return _cached_section("toc", generate_TOC, _bullets(merged), max_level, use_cache=use_cache)
+        entries = merged
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.db import connect
+from app.utils.logger import get_logger
+
+logger = get_logger("summary_store")
+
+SUMMARY_STORE_BACKEND = os.getenv("SUMMARY_STORE_BACKEND", "sqlite")  # "sqlite" or "memory"
+SUMMARY_STORE_FILE = os.getenv("SUMMARY_STORE_FILE", "data/processed/summaries.sqlite")
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "256"))  # summaries kept decoded in memory
+
+
+class SummaryStore(ABC):
+    """Interface of the summary stores: payloads are the dicts built by `create_summary`."""
+
+    @abstractmethod
+    def get(self, summary_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put(self, payload: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def list(self, source: str = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Newest first: {id, source, created, updated} of each summary (of `source`, if given)."""
+        ...
+
+    @abstractmethod
+    def delete(self, summary_id: str) -> bool:
+        ...
+
+
+def _info(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: payload.get(k) for k in ("id", "source", "created", "updated")}
+
+
+class MemorySummaryStore(SummaryStore):
+    """Bounded LRU in this process only; for development and single-worker deployments."""
+
+    def __init__(self, max_entries: int = SUMMARY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, summary_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            payload = self._entries.get(summary_id)
+            if payload is not None:
+                self._entries.move_to_end(summary_id)
+            return payload
+
+    def put(self, payload: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            previous = self._entries.pop(payload["id"], None)
+            payload["created"] = previous["created"] if previous else now
+            payload["updated"] = now
+            self._entries[payload["id"]] = payload
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def list(self, source: str = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [_info(p) for p in self._entries.values() if source is None or p.get("source") == source]
+        items.sort(key=lambda p: p["updated"], reverse=True)
+        return items[offset:offset + limit]
+
+    def delete(self, summary_id: str) -> bool:
+        with self._lock:
+            return self._entries.pop(summary_id, None) is not None
+
+
+class SQLiteSummaryStore(SummaryStore):
+    """
+    Summaries persisted in SQLite, shared by every worker process, with an LRU front of
+    decoded payloads. A cached payload is served only while its `updated` stamp still matches
+    the database, so a revision written by another worker is never hidden.
+    """
+
+    def __init__(self, path: str = SUMMARY_STORE_FILE, cache_size: int = SUMMARY_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS summaries (id TEXT PRIMARY KEY, source TEXT, payload TEXT, "
+                         "created REAL, updated REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS summaries_source ON summaries (source, updated)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS summaries_updated ON summaries (updated)")
+        self._db.commit()
+
+    def get(self, summary_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._cache.get(summary_id)
+            if cached is not None:
+                row = self._db.execute("SELECT updated FROM summaries WHERE id = ?", (summary_id,)).fetchone()
+                if row is not None and row[0] == cached[0]:
+                    self._cache.move_to_end(summary_id)
+                    return cached[1]
+            row = self._db.execute("SELECT payload, updated FROM summaries WHERE id = ?", (summary_id,)).fetchone()
+            if row is None:
+                self._cache.pop(summary_id, None)
+                return None
+            payload = json.loads(row[0])
+            self._remember(summary_id, row[1], payload)
+            return payload
+
+    def put(self, payload: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT created FROM summaries WHERE id = ?", (payload["id"],)).fetchone()
+            payload["created"] = row[0] if row else now
+            payload["updated"] = now
+            self._db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                             (payload["id"], payload.get("source"), json.dumps(payload), payload["created"], now))
+            self._db.commit()
+            self._remember(payload["id"], now, payload)
+
+    def _remember(self, summary_id: str, updated: float, payload: Dict[str, Any]):
+        self._cache[summary_id] = (updated, payload)
+        self._cache.move_to_end(summary_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def list(self, source: str = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        query = "SELECT id, source, created, updated FROM summaries"
+        args: list = []
+        if source is not None:
+            query += " WHERE source = ?"
+            args.append(source)
+        query += " ORDER BY updated DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._db.execute(query, (*args, limit, offset)).fetchall()
+        return [{"id": r[0], "source": r[1], "created": r[2], "updated": r[3]} for r in rows]
+
+    def delete(self, summary_id: str) -> bool:
+        with self._lock:
+            self._cache.pop(summary_id, None)
+            deleted = self._db.execute("DELETE FROM summaries WHERE id = ?", (summary_id,)).rowcount
+            self._db.commit()
+            return deleted > 0
+
+
+def open_store() -> SummaryStore:
+    """The store selected by SUMMARY_STORE_BACKEND."""
+    if SUMMARY_STORE_BACKEND == "memory":
+        return MemorySummaryStore()
+    if SUMMARY_STORE_BACKEND == "sqlite":
+        return SQLiteSummaryStore()
+    raise ValueError(f"SUMMARY_STORE_BACKEND must be 'sqlite' or 'memory', got {SUMMARY_STORE_BACKEND!r}")
@@ -0,0 +1,26 @@
+import json
+from typing import Any, AsyncIterator, Tuple
+from fastapi.responses import StreamingResponse
+from app.utils.logger import get_logger
+
+logger = get_logger("sse")
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _format(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield sse_event(event, data)
+    except Exception as e:
+        # the 200 status is already sent, so failures are reported in-band
+        logger.warning("Stream failed: %s", e)
+        yield sse_event("error", {"detail": str(e)})
+
+
+def sse_response(events: AsyncIterator[Tuple[str, Any]]) -> StreamingResponse:
+    """Send (event, data) pairs as Server-Sent Events; an exception ends the stream with an `error` event."""
+    return StreamingResponse(_format(events), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,35 @@
+"""
+Recall vs latency of the ANN index types against the exact flat index,
+measured on the vectors already ingested into the FAISS store.
+
+Run from the repo root:
+    python -m benchmarks.bench_ann --queries 200 --k 10
+"""
+import os
+import argparse
+import numpy as np
+from app.services import ann_index
+
+DEFAULT_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "data/processed/faiss")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--dim", type=int, default=1024, help="embedding dimension (1024 for bge-large)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = np.memmap(os.path.join(args.index_dir, "vectors.f32"), dtype="float32", mode="r").reshape(-1, args.dim)
+    print(f"{len(vectors)} vectors, dim={args.dim}, k={args.k}, queries={args.queries}\n")
+
+    report = ann_index.recall_report(vectors, n_queries=args.queries, k=args.k)
+    print(f"{'index':<10}{'nprobe':>8}{'efSearch':>10}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}")
+    for row in report:
+        print(f"{row['index_type']:<10}{row.get('nprobe', '-'):>8}{row.get('ef_search', '-'):>10}"
+              f"{row['recall_at_k']:>10.4f}{row['latency_ms_p50']:>10.3f}{row['latency_ms_p95']:>10.3f}{row['build_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Real-time factor and word error rate of the ASR backends on a clip of your own
+(no audio ships with the repo): each backend / model / compute type transcribes
+the clip window by window exactly as the API does, in this process.
+RTF is transcription time over audio duration (lower is faster, < 1 is faster than
+real time); WER needs a reference transcript of the clip.
+
+Run from the repo root:
+    python -m benchmarks.bench_asr --audio clip.wav --reference clip.txt --models base small
+"""
+import re
+import time
+import argparse
+from typing import List
+
+
+def _words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """(substitutions + deletions + insertions) / reference words, by word-level edit distance."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, start=1):
+        previous, row[0] = row[0], i
+        for j, h in enumerate(hyp, start=1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (r != h))
+    return row[-1] / max(1, len(ref))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", required=True, help="audio or video clip (anything ffmpeg reads)")
+    parser.add_argument("--reference", help="text file with the reference transcript, for WER")
+    parser.add_argument("--backends", nargs="+", default=["openai-whisper", "faster-whisper"])
+    parser.add_argument("--models", nargs="+", default=["base"])
+    parser.add_argument("--compute-types", nargs="+", default=["int8"], help="faster-whisper weight types")
+    args = parser.parse_args()
+
+    from app.services import asr, preprocessing
+    reference = open(args.reference, encoding="utf-8").read() if args.reference else None
+    windows = list(preprocessing.iter_audio_windows(args.audio, preprocessing.OVERLAP_SECONDS))
+    duration = max((start + len(samples) / preprocessing.SAMPLE_RATE for start, samples in windows), default=0.0)
+    print(f"{args.audio}: {duration:.0f}s of audio in {len(windows)} windows\n")
+
+    configs = [(backend, model, compute_type if backend == "faster-whisper" else "fp32")
+               for backend in args.backends for model in args.models
+               for compute_type in (args.compute_types if backend == "faster-whisper" else [None])]
+    print(f"{'backend':<16}{'model':<10}{'weights':<10}{'load s':>8}{'wall s':>9}{'RTF':>8}{'WER':>8}")
+    for backend_name, model, weights in configs:
+        options = {"compute_type": weights} if backend_name == "faster-whisper" else {}
+        start = time.perf_counter()
+        backend = asr.open_backend(backend_name, model, **options)
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stitcher, prompt, texts = preprocessing.Stitcher(), None, []
+        for begin, samples in windows:
+            segments = stitcher.add(begin, begin + len(samples) / preprocessing.SAMPLE_RATE,
+                                    preprocessing.transcribe_window(samples, begin, prompt, backend))
+            texts += [s["text"] for s in segments]
+            prompt = preprocessing._next_prompt(segments, prompt)
+        wall_s = time.perf_counter() - start
+
+        wer = f"{word_error_rate(reference, ' '.join(texts)):.3f}" if reference else "-"
+        print(f"{backend_name:<16}{model:<10}{weights:<10}{load_s:>8.1f}{wall_s:>9.1f}{wall_s / max(duration, 1e-9):>8.3f}{wer:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Wall time of parallel transcription vs worker count and window (segment) count,
+on a recording of your own: the audio is cut into windows at silences exactly as
+the API does, then the windows are transcribed in a spawn process pool where every
+worker holds its own Whisper model (loaded before timing starts). Speedup is
+relative to the first --workers value for the same window length.
+
+Run from the repo root:
+    python -m benchmarks.bench_transcription --audio lecture.mp3 --workers 1 2 4 8 --window 30 15
+"""
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _init_worker(barrier):
+    from app.services import preprocessing, model_registry  # importing preprocessing registers the model
+    model_registry.get("whisper")
+    barrier.wait()  # timing starts once every worker has its model
+
+
+def _ready(_):
+    return None
+
+
+def _transcribe(window):
+    from app.services.preprocessing import transcribe_window
+    start, samples = window
+    return transcribe_window(samples, start)
+
+
+def _time_pool(windows, workers: int) -> float:
+    os.environ["PROCESS_WORKERS"] = str(workers)  # read by the workers: torch threads per worker
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(barrier,)) as pool:
+        list(pool.map(_ready, range(workers)))  # one task per worker spawns them all
+        start = time.perf_counter()
+        list(pool.map(_transcribe, windows))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", required=True, help="audio or video file (anything ffmpeg reads)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--window", type=float, nargs="+", default=[30.0], help="max window length(s) in seconds")
+    args = parser.parse_args()
+
+    from app.services import preprocessing, asr
+    print(f"{args.audio}: {os.cpu_count()} cores, {asr.ASR_BACKEND} {asr.WHISPER_MODEL}\n")
+    print(f"{'window s':>9}{'segments':>10}{'audio s':>9}{'workers':>9}{'wall s':>9}{'x realtime':>12}{'speedup':>9}")
+    for window in args.window:
+        preprocessing.WINDOW_SECONDS = window
+        windows = list(preprocessing.iter_audio_windows(args.audio, preprocessing.OVERLAP_SECONDS))
+        audio_s = sum(len(samples) for _, samples in windows) / preprocessing.SAMPLE_RATE
+        baseline = None
+        for workers in args.workers:
+            elapsed = _time_pool(windows, workers)
+            baseline = baseline or elapsed
+            print(f"{window:>9.0f}{len(windows):>10}{audio_s:>9.0f}{workers:>9}{elapsed:>9.1f}"
+                  f"{audio_s / elapsed:>12.1f}{baseline / elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
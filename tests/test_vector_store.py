@@ -0,0 +1,206 @@
+"""
+On-disk formats and crash recovery of the vector store, driven through the public
+ingest/delete API against a temporary FAISS_INDEX_DIR with a stub encoder.
+"""
+import os
+import json
+import hashlib
+import importlib
+import numpy as np
+import pytest
+
+from app.services import embeddings
+from app.services.metadata_store import MetadataStore, ContentHashIndex, _ENTRY
+
+DIM = 8
+
+
+class _Tokenizer:
+    def tokenize(self, text):
+        return text.split()
+
+
+class StubEncoder:
+    """Deterministic pseudo-embeddings: the same text always gets the same vector."""
+
+    tokenizer = _Tokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, **kwargs):
+        seeds = [int.from_bytes(hashlib.sha1(t.encode("utf-8")).digest()[:4], "little") for t in texts]
+        return np.stack([np.random.default_rng(s).standard_normal(DIM).astype("float32") for s in seeds])
+
+
+_STUB = StubEncoder()
+
+
+@pytest.fixture
+def open_store(tmp_path, monkeypatch):
+    """Returns a function that (re)opens the store, as a process restart would."""
+    monkeypatch.setenv("FAISS_INDEX_DIR", str(tmp_path))
+    monkeypatch.setenv("FAISS_LOG_FSYNC", "0")
+    monkeypatch.setenv("FAISS_COMPACT_EVERY", "1000000")  # no background snapshots
+    monkeypatch.setenv("FAISS_COMPACT_DELETED_RATIO", "1.0")  # no background rebuilds
+
+    def reopen():
+        module = importlib.reload(embeddings)
+        module._embed_model = lambda: _STUB
+        module._init_index()
+        return module
+
+    return reopen
+
+
+def _docs(*ids, source="notes.pdf"):
+    return [{"id": i, "text": f"Text of document {i}.", "source": source} for i in ids]
+
+
+def _found_doc_ids(store, doc_id):
+    return {md["doc_id"] for _, md in store.search(f"Text of document {doc_id}.", k=10)}
+
+
+def test_rows_are_replayed_after_restart(open_store):
+    store = open_store()
+    store.add_documents(_docs("a", "b"))
+    store._save_index()  # snapshot covers a and b
+    store.add_documents(_docs("c"))  # only in the logs
+
+    store = open_store()
+    assert store.get_index_size() == 3
+    assert "c" in _found_doc_ids(store, "c")
+
+
+def test_torn_vector_row_is_truncated(open_store):
+    store = open_store()
+    store.add_documents(_docs("a", "b"))
+    with open(store.VECTOR_LOG, "ab") as f:
+        f.write(b"\0" * (DIM * 4 // 2))  # crash halfway through a row
+
+    store = open_store()
+    assert os.path.getsize(store.VECTOR_LOG) == 2 * DIM * 4
+    assert store.get_index_size() == 2
+    store.add_documents(_docs("c"))
+    assert _found_doc_ids(store, "c") >= {"c"}
+
+
+def test_metadata_without_vectors_is_dropped(open_store):
+    store = open_store()
+    store.add_documents(_docs("a"))
+    # crash after the metadata, digest and doc key were written but before the vectors
+    record = {"doc_id": "b", "chunk_id": "b#0", "chunk_index": 0, "page": 1, "source": "notes.pdf",
+              "text": "Text of document b.", "meta": {}}
+    store._meta_store.append([record])
+    store._hash_index.append([store.content_hash(record["text"])])
+    store._key_store.append([{"doc_id": "b", "source": "notes.pdf"}])
+
+    store = open_store()
+    assert len(store._meta_store) == len(store._hash_index) == len(store._key_store) == 1
+    added, duplicates = store.add_documents(_docs("b"))  # not mistaken for a duplicate
+    assert added == ["b#0"] and duplicates == []
+
+
+def test_duplicates_are_skipped_across_restarts(open_store):
+    store = open_store()
+    store.add_documents(_docs("a"))
+
+    store = open_store()
+    added, duplicates = store.add_documents([{"id": "a2", "text": "Text  of document a.", "source": "x"}])
+    assert added == [] and duplicates == ["a2#0"]
+
+
+def test_deletes_survive_restart(open_store):
+    store = open_store()
+    store.add_documents(_docs("a", "b"))
+    store.add_documents(_docs("c", source="other.pdf"))
+    assert store.delete_documents(doc_ids=["a"]) == 1
+    assert store.delete_documents(source="other.pdf") == 1
+    assert "a" not in _found_doc_ids(store, "a")
+
+    store = open_store()
+    assert store.get_index_size() == 1
+    assert _found_doc_ids(store, "a") == {"b"}
+    assert store.delete_documents(doc_ids=["a"]) == 0
+    added, _ = store.add_documents(_docs("a"))  # deleted text can be ingested again
+    assert added == ["a#0"]
+
+
+def test_tombstones_across_rebuild(open_store):
+    store = open_store()
+    store.add_documents(_docs("a", "b", "c"))
+    store.delete_documents(doc_ids=["a"])
+
+    build_index = store.ann_index.build_index
+
+    def build_during_ingest(*args, **kwargs):
+        # rows ingested, and some deleted, while the rebuild runs
+        store.add_documents(_docs("d", "e"))
+        store.delete_documents(doc_ids=["b", "d"])
+        return build_index(*args, **kwargs)
+
+    store.ann_index.build_index = build_during_ingest
+    try:
+        store._retrain("flat")
+    finally:
+        store.ann_index.build_index = build_index
+    assert store._index.ntotal == 3  # b, c and e: a was dropped, d was deleted before the catch-up
+    assert store._deleted_in_index == {1}  # b was in the rebuilt index when it was deleted
+    assert store.get_index_size() == 2
+
+    store = open_store()
+    assert store.get_index_size() == 2
+    assert {md["doc_id"] for _, md in store.search("document", k=10)} == {"c", "e"}
+
+
+def test_legacy_json_metadata_is_migrated(open_store, tmp_path):
+    records = {str(row): {"doc_id": doc_id, "chunk_id": doc_id, "source": "old.pdf",
+                          "text": f"Text of document {doc_id}.", "meta": {}}
+               for row, doc_id in enumerate(["a", "b"])}
+    with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    vectors = _STUB.encode([r["text"] for r in records.values()])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    with open(tmp_path / "vectors.f32", "wb") as f:
+        f.write(vectors.tobytes())
+
+    store = open_store()
+    assert not (tmp_path / "meta.json").exists() and (tmp_path / "meta.json.migrated").exists()
+    assert store.get_index_size() == 2
+    assert "b" in _found_doc_ids(store, "b")
+    assert store.delete_documents(source="old.pdf") == 2  # doc keys were backfilled
+    added, _ = store.add_documents(_docs("c"))
+    assert added == ["c#0"]
+
+
+def test_metadata_store_drops_torn_records(tmp_path):
+    store = MetadataStore(str(tmp_path))
+    store.append([{"n": 0}, {"n": 1}, {"n": 2}], fsync=False)
+    store.close()
+    with open(store.blob_path, "r+b") as f:  # last record only half written
+        f.truncate(os.path.getsize(store.blob_path) - 3)
+    with open(store.idx_path, "ab") as f:  # and a torn offset entry after it
+        f.write(b"\1" * (_ENTRY.size // 2))
+
+    store = MetadataStore(str(tmp_path))
+    assert len(store) == 2
+    assert store.get_many([0, 1, 2]) == [{"n": 0}, {"n": 1}, None]
+    store.update(1, {"n": 10}, fsync=False)
+    assert store.append([{"n": 3}], fsync=False) == 2
+    store.close()
+    assert MetadataStore(str(tmp_path)).get_many([1, 2]) == [{"n": 10}, {"n": 3}]
+
+
+def test_content_hash_index_truncates_partial_digest(tmp_path):
+    path = str(tmp_path / "content.hash")
+    index = ContentHashIndex(path)
+    digests = [bytes([i + 1]) * ContentHashIndex.DIGEST_SIZE for i in range(3)]
+    index.append(digests, fsync=False)
+    index.clear([1], fsync=False)
+    with open(path, "ab") as f:
+        f.write(b"\7" * 5)
+
+    index = ContentHashIndex(path)
+    assert len(index) == 3
+    assert os.path.getsize(path) == 3 * ContentHashIndex.DIGEST_SIZE
+    assert [index.get(d) for d in digests] == [0, None, 2]